@@ -0,0 +1,190 @@
+"""Sales analytics over the daily rollup tables, computed with pandas"""
+import numpy as np
+import pandas as pd
+
+CHUNKSIZE = 50000
+
+# Column headings for as_table; other columns are title-cased
+HEADINGS = {
+    "hsn": "HSN",
+    "share": "Share %",
+    "cumulative_share": "Cumulative %",
+    "abc_class": "Class",
+    "growth": "Growth %",
+}
+
+
+def _read_chunks(conn, query, params, chunksize):
+    """Read a query into one DataFrame, chunksize rows at a time"""
+    chunks = pd.read_sql_query(query, conn, params=params, chunksize=chunksize)
+    frame = pd.concat(chunks, ignore_index=True)
+    frame["date"] = pd.to_datetime(frame["date"], format="%Y-%m-%d")
+    return frame
+
+
+def _date_filter(from_date, to_date):
+    """WHERE clause and parameters for an optional range of ISO dates"""
+    if from_date and to_date:
+        return "WHERE date BETWEEN ? AND ?", (from_date, to_date)
+    return "", ()
+
+
+def load_daily_sales(conn, from_date=None, to_date=None, chunksize=CHUNKSIZE):
+    """Invoices and sales per day: columns date, invoices, total"""
+    where, params = _date_filter(from_date, to_date)
+    return _read_chunks(conn, f"""
+        SELECT date, SUM(invoices) AS invoices, SUM(total) AS total
+        FROM sales_daily {where}
+        GROUP BY date
+        ORDER BY date
+    """, params, chunksize)
+
+
+def load_product_sales(conn, from_date=None, to_date=None, chunksize=CHUNKSIZE):
+    """Sales per day and product: columns date, hsn, name, quantity, total"""
+    where, params = _date_filter(from_date, to_date)
+    frame = _read_chunks(conn, f"""
+        SELECT s.date, s.hsn, p.name, s.quantity, s.total
+        FROM (SELECT * FROM sales_daily_hsn {where}) s
+        LEFT JOIN products p ON p.hsn = s.hsn
+    """, params, chunksize)
+    # Few products repeat over many days
+    frame["hsn"] = frame["hsn"].astype("category")
+    return frame
+
+
+def load_customer_sales(conn, from_date=None, to_date=None, chunksize=CHUNKSIZE):
+    """Sales per day and customer: columns date, customer, name, invoices, total.
+
+    customer is the mobile number, or the name when there is none.
+    """
+    where, params = _date_filter(from_date, to_date)
+    frame = _read_chunks(conn, f"""
+        SELECT date, customer, name, invoices, total
+        FROM sales_daily_customer {where}
+    """, params, chunksize)
+    frame["customer"] = frame["customer"].astype("category")
+    return frame
+
+
+def _product_totals(product_sales):
+    """Quantity and revenue per product, highest revenue first"""
+    totals = product_sales.groupby("hsn", observed=True).agg(
+        name=("name", "last"),
+        quantity=("quantity", "sum"),
+        revenue=("total", "sum"),
+    )
+    return totals.sort_values("revenue", ascending=False).reset_index()
+
+
+def top_products(product_sales, n=20):
+    """The n products with the highest revenue and their share of all sales"""
+    totals = _product_totals(product_sales)
+    revenue = totals["revenue"].sum()
+    totals["average_price"] = totals["revenue"] / totals["quantity"].replace(0, np.nan)
+    totals["share"] = totals["revenue"] / revenue * 100 if revenue else 0.0
+    return totals.head(n)
+
+
+def abc_classification(product_sales, a_share=0.8, b_share=0.95):
+    """Class every product A, B or C by its place in cumulative revenue.
+
+    Products are taken in order of revenue: those before the running total
+    reaches a_share of all revenue are A, then B up to b_share, the rest C.
+    """
+    totals = _product_totals(product_sales)
+    revenue = totals["revenue"].to_numpy()
+    share = revenue / revenue.sum() if revenue.sum() else np.zeros(len(revenue))
+    cumulative = np.cumsum(share)
+    before = cumulative - share
+    totals["share"] = share * 100
+    totals["cumulative_share"] = cumulative * 100
+    totals["abc_class"] = np.select([before < a_share, before < b_share], ["A", "B"], "C")
+    return totals
+
+
+def _daily_series(daily_sales):
+    """Total sales per calendar day, with days without sales as zero"""
+    series = daily_sales.set_index("date")["total"]
+    if series.empty:
+        return series
+    days = pd.date_range(series.index.min(), series.index.max(), freq="D")
+    return series.reindex(days, fill_value=0.0).rename_axis("date")
+
+
+def moving_averages(daily_sales, windows=(7, 30)):
+    """Daily sales with their trailing moving average over each window of days"""
+    series = _daily_series(daily_sales)
+    frame = series.to_frame("total")
+    for window in windows:
+        frame[f"average_{window}_days"] = series.rolling(window, min_periods=1).mean()
+    return frame.reset_index()
+
+
+def period_growth(daily_sales, freq="M"):
+    """Sales per period (W, M, Q or Y) and the percentage change on the period before"""
+    periods = daily_sales["date"].dt.to_period(freq)
+    totals = daily_sales.groupby(periods)["total"].sum()
+    if not totals.empty:
+        totals = totals.reindex(pd.period_range(totals.index.min(), totals.index.max(), freq=freq), fill_value=0.0)
+    frame = totals.rename_axis("period").to_frame("total")
+    frame["growth"] = frame["total"].pct_change().replace([np.inf, -np.inf], np.nan) * 100
+    return frame.reset_index()
+
+
+def customer_lifetime_value(customer_sales, lifespan_years=3.0, as_of=None):
+    """Historic and projected value of each customer, highest projected first.
+
+    A repeat customer's yearly value is their revenue over the analysed
+    period, from the first sale in customer_sales to as_of; the lifetime
+    value projects it over lifespan_years. A customer who bought on a single
+    day shows no purchase pattern, so their lifetime value is what they spent.
+    """
+    if as_of is None:
+        as_of = customer_sales["date"].max()
+    customers = customer_sales.groupby("customer", observed=True).agg(
+        name=("name", "last"),
+        first_purchase=("date", "min"),
+        last_purchase=("date", "max"),
+        purchase_days=("date", "nunique"),
+        invoices=("invoices", "sum"),
+        revenue=("total", "sum"),
+    )
+    customers["average_invoice"] = customers["revenue"] / customers["invoices"]
+    period_years = ((as_of - customer_sales["date"].min()).days + 1) / 365.25
+    repeat = customers["purchase_days"] > 1
+    customers["yearly_value"] = (customers["revenue"] / period_years).where(repeat)
+    customers["lifetime_value"] = (customers["yearly_value"] * lifespan_years).where(repeat, customers["revenue"])
+    return customers.sort_values("lifetime_value", ascending=False).reset_index()
+
+
+# Name shown in the Analytics view: (loader, analysis)
+REPORTS = {
+    "Top Products": (load_product_sales, top_products),
+    "ABC Classification": (load_product_sales, abc_classification),
+    "Moving Averages": (load_daily_sales, moving_averages),
+    "Monthly Growth": (load_daily_sales, period_growth),
+    "Customer Lifetime Value": (load_customer_sales, customer_lifetime_value),
+}
+
+
+def run_report(conn, name, from_date=None, to_date=None):
+    """The DataFrame of a REPORTS analysis over a range of ISO dates, None meaning unbounded"""
+    load, analyse = REPORTS[name]
+    return analyse(load(conn, from_date, to_date))
+
+
+def as_table(frame, date_format="%d-%m-%Y"):
+    """(headings, rows) of a DataFrame, every value formatted as text"""
+    columns = []
+    for name in frame.columns:
+        column = frame[name]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.strftime(date_format)
+        elif pd.api.types.is_float_dtype(column):
+            column = column.map(lambda value: "" if pd.isna(value) else f"{value:,.2f}")
+        else:
+            column = column.map(lambda value: "" if pd.isna(value) else str(value))
+        columns.append(column.tolist())
+    headings = [HEADINGS.get(name, name.replace("_", " ").title()) for name in frame.columns]
+    return headings, list(zip(*columns))
@@ -1,26 +1,2858 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog, scrolledtext
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.pdfgen import canvas
 from reportlab.lib import colors
-from reportlab.platypus import Table, TableStyle, Paragraph
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import (
+    Table, LongTable, TableStyle, Paragraph, Spacer, KeepTogether, Flowable,
+    BaseDocTemplate, PageTemplate, Frame
+)
 from reportlab.lib.styles import getSampleStyleSheet
-from num2words import num2words
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 import os
 import platform
 import subprocess
 import sys
 import json
+import io
+import csv
+import re
 from tkinter import font as tkfont
 import webbrowser
 import pandas as pd
 from PIL import Image, ImageTk
 import sqlite3
+import numpy as np
 import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import qrcode
+import analytics
 import threading
+import time
+import copy
+import bisect
+import heapq
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+
+def to_paise(amount):
+    """Convert a rupee amount (str, int, float or Decimal) to integer paise"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def paise_to_rupees(paise):
+    """Convert integer paise to an exact Decimal rupee amount"""
+    return Decimal(paise).scaleb(-2)
+
+
+_ONES = [
+    "", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine",
+    "Ten", "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen",
+    "Seventeen", "Eighteen", "Nineteen"
+]
+_TENS = ["", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
+
+
+def _below_hundred_in_words(n):
+    if n < 20:
+        return _ONES[n]
+    return f"{_TENS[n // 10]} {_ONES[n % 10]}".strip()
+
+
+def _number_in_words(n):
+    """Spell out a whole number using the Indian crore/lakh/thousand grouping"""
+    words = []
+    crores, n = divmod(n, 10_000_000)
+    lakhs, n = divmod(n, 100_000)
+    thousands, n = divmod(n, 1000)
+    hundreds, n = divmod(n, 100)
+    if crores:
+        words.append(f"{_number_in_words(crores)} Crore")
+    if lakhs:
+        words.append(f"{_below_hundred_in_words(lakhs)} Lakh")
+    if thousands:
+        words.append(f"{_below_hundred_in_words(thousands)} Thousand")
+    if hundreds:
+        words.append(f"{_ONES[hundreds]} Hundred")
+    if n:
+        words.append(_below_hundred_in_words(n))
+    return " ".join(words)
+
+
+@lru_cache(maxsize=1024)
+def amount_in_words(paise):
+    """Amount in words for an invoice total given in integer paise,
+    e.g. 12345050 -> "One Lakh Twenty Three Thousand Four Hundred Fifty Rupees
+    And Fifty Paise Only"
+    """
+    rupees, paise = divmod(abs(int(paise)), 100)
+    words = f"{_number_in_words(rupees) or 'Zero'} {'Rupee' if rupees == 1 else 'Rupees'}"
+    if paise:
+        words += f" And {_below_hundred_in_words(paise)} Paise"
+    return words + " Only"
+
+
+class InvoiceTotals:
+    """Immutable snapshot of the invoice totals, all amounts in paise"""
+    __slots__ = ("subtotal", "sgst", "igst", "roundoff", "total")
+
+    def __init__(self, subtotal, sgst, igst, roundoff, total):
+        self.subtotal = subtotal
+        self.sgst = sgst
+        self.igst = igst
+        self.roundoff = roundoff
+        self.total = total
+
+
+class TotalsAccumulator:
+    """Incrementally maintained invoice totals.
+
+    Line changes are applied as deltas in integer paise, so keeping the totals
+    current costs the same regardless of how many lines the invoice has. Taxes
+    and round-off are derived from the running subtotal on demand and cached
+    until the next change.
+    """
+
+    def __init__(self, sgst_rate=0, igst_rate=0):
+        self.items_paise = 0
+        self.discount_paise = 0
+        self.sgst_rate = Decimal(str(sgst_rate))
+        self.igst_rate = Decimal(str(igst_rate))
+        self._snapshot = None
+
+    def apply(self, delta_paise):
+        """Apply the change in a line total"""
+        if delta_paise:
+            self.items_paise += delta_paise
+            self._snapshot = None
+
+    def set_rates(self, sgst_rate, igst_rate):
+        """Set the SGST/IGST percentages"""
+        sgst_rate = Decimal(str(sgst_rate))
+        igst_rate = Decimal(str(igst_rate))
+        if (sgst_rate, igst_rate) != (self.sgst_rate, self.igst_rate):
+            self.sgst_rate = sgst_rate
+            self.igst_rate = igst_rate
+            self._snapshot = None
+
+    def set_discount(self, discount_paise):
+        """Set the invoice level discount"""
+        if discount_paise < 0 or discount_paise > self.items_paise:
+            raise ValueError("Discount cannot be greater than subtotal")
+        self.discount_paise = discount_paise
+        self._snapshot = None
+
+    def reset(self):
+        """Clear all amounts, keeping the tax rates"""
+        self.items_paise = 0
+        self.discount_paise = 0
+        self._snapshot = None
+
+    def _tax(self, subtotal, rate):
+        return int((subtotal * rate / 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+    def totals(self):
+        """Return the current InvoiceTotals"""
+        if self._snapshot is None:
+            subtotal = max(self.items_paise - self.discount_paise, 0)
+            sgst = self._tax(subtotal, self.sgst_rate)
+            igst = self._tax(subtotal, self.igst_rate)
+            grand_total = subtotal + sgst + igst
+            # Round to the nearest rupee, halves away from zero
+            final_total = (grand_total + 50) // 100 * 100
+            self._snapshot = InvoiceTotals(
+                subtotal, sgst, igst, final_total - grand_total, final_total
+            )
+        return self._snapshot
+
+
+class InvoiceLine:
+    """A single line item of the invoice being edited"""
+    __slots__ = ("iid", "sno", "hsn", "description", "price_paise", "quantity", "total_paise")
+
+    def __init__(self, iid, sno, hsn, description, price_paise, quantity):
+        self.iid = iid
+        self.sno = sno
+        self.hsn = hsn
+        self.description = description
+        self.price_paise = price_paise
+        self.quantity = quantity
+        self.total_paise = price_paise * quantity
+
+    @property
+    def price(self):
+        return self.price_paise / 100
+
+    @property
+    def total(self):
+        return self.total_paise / 100
+
+    def values(self):
+        """Values as displayed in the product table"""
+        return (
+            self.sno,
+            self.hsn,
+            self.description,
+            f"{self.price:.2f}",
+            self.quantity,
+            f"{self.total:.2f}"
+        )
+
+
+class InvoiceModel:
+    """In-memory store for the line items of the current invoice.
+
+    The model owns the line data and feeds every change to its
+    TotalsAccumulator. The optional Treeview passed as ``view`` only mirrors
+    the model and is never read back.
+    """
+
+    def __init__(self, view=None):
+        self.view = view
+        self.lines = {}  # iid -> InvoiceLine, in display order
+        self.totals = TotalsAccumulator()
+        self._next_iid = 0
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines.values())
+
+    def get(self, iid):
+        """Return the line for a Treeview item id"""
+        return self.lines.get(iid)
+
+    def add(self, hsn, description, price, quantity):
+        """Append a line and return it"""
+        self._next_iid += 1
+        iid = f"L{self._next_iid}"
+        line = InvoiceLine(iid, len(self.lines) + 1, hsn, description, to_paise(price), quantity)
+        self.lines[iid] = line
+        self.totals.apply(line.total_paise)
+        if self.view is not None:
+            self.view.insert("", "end", iid=iid, values=line.values())
+        return line
+
+    def update(self, iid, hsn, description, price, quantity):
+        """Replace the contents of an existing line"""
+        line = self.lines[iid]
+        old_total = line.total_paise
+        line.hsn = hsn
+        line.description = description
+        line.price_paise = to_paise(price)
+        line.quantity = quantity
+        line.total_paise = line.price_paise * quantity
+        self.totals.apply(line.total_paise - old_total)
+        self._drop_excess_discount()
+        if self.view is not None:
+            self.view.item(iid, values=line.values())
+        return line
+
+    def add_quantity(self, iid, amount):
+        """Increase the quantity of an existing line"""
+        line = self.lines[iid]
+        return self.update(iid, line.hsn, line.description, line.price, line.quantity + amount)
+
+    def remove(self, iids):
+        """Remove lines and renumber the ones that follow them"""
+        removed = [self.lines.pop(iid) for iid in iids if iid in self.lines]
+        if not removed:
+            return
+        self.totals.apply(-sum(line.total_paise for line in removed))
+        self._drop_excess_discount()
+        if self.view is not None:
+            self.view.delete(*[line.iid for line in removed])
+
+        first_sno = min(line.sno for line in removed)
+        for sno, line in enumerate(self.lines.values(), 1):
+            if sno >= first_sno and line.sno != sno:
+                line.sno = sno
+                if self.view is not None:
+                    self.view.item(line.iid, values=line.values())
+
+    def _drop_excess_discount(self):
+        # A discount larger than the lines that are left no longer applies;
+        # BillingSystem.report_dropped_discount tells the cashier
+        if self.totals.discount_paise > self.totals.items_paise:
+            self.totals.set_discount(0)
+
+    def clear(self):
+        """Remove all lines"""
+        if self.view is not None and self.lines:
+            self.view.delete(*self.lines)
+        self.lines.clear()
+        self.totals.reset()
+
+    def rows(self):
+        """Line items as (sno, hsn, description, price, quantity, total) tuples"""
+        return [
+            (line.sno, line.hsn, line.description, line.price, line.quantity, line.total)
+            for line in self.lines.values()
+        ]
+
+
+def resource_path(name):
+    """Path of a file bundled next to the application (or inside the PyInstaller bundle)"""
+    if getattr(sys, 'frozen', False):
+        return os.path.join(sys._MEIPASS, name)
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+
+# Config keys that make up the static letterhead
+LETTERHEAD_KEYS = (
+    "company_name", "company_address", "company_phone", "company_email",
+    "gstin", "bank_details", "primary_color"
+)
+
+# Baseline of the first footer line; invoice content has to stay above it
+LETTERHEAD_FOOTER_TOP = 110
+
+
+class Letterhead:
+    """Static part of the invoice page, prepared once per company config.
+
+    The logo is decoded a single time, and inside each PDF the letterhead is
+    emitted once as a form XObject that every page only references.
+    """
+    FORM_NAME = "letterhead"
+
+    def __init__(self, config):
+        self.company_name = config["company_name"]
+        self.company_address = config["company_address"]
+        self.contact = f"Phone: {config['company_phone']} | Email: {config.get('company_email', '')}"
+        self.gstin = f"GSTIN: {config['gstin']}"
+        self.bank_details = [
+            f"Bank: {config['bank_details']['name']}",
+            f"A/C No: {config['bank_details']['account']}",
+            f"IFSC: {config['bank_details']['ifsc']}",
+            f"Branch: {config['bank_details']['branch']}"
+        ]
+        self.primary_color = colors.HexColor(config["primary_color"])
+
+        self.logo = None
+        try:
+            logo_path = resource_path("logo.png")
+            if os.path.exists(logo_path):
+                with open(logo_path, "rb") as f:
+                    self.logo = ImageReader(io.BytesIO(f.read()))
+                self.logo.getRGBData()  # decode now rather than once per invoice
+        except Exception as e:
+            self.logo = None
+            print(f"Error loading logo for PDF: {e}")
+
+    def draw(self, c, width, height):
+        """Draw the letterhead on the current page"""
+        if not c.hasForm(self.FORM_NAME):
+            c.beginForm(self.FORM_NAME)
+            self._draw_static(c, width, height)
+            c.endForm()
+        c.doForm(self.FORM_NAME)
+
+    def _draw_static(self, c, width, height):
+        if self.logo is not None:
+            c.drawImage(self.logo, 40, height - 80, width=50, height=50)
+
+        # Header
+        c.setFont("Helvetica-Bold", 16)
+        c.setFillColor(self.primary_color)
+        c.drawCentredString(width / 2.0, height - 50, self.company_name)
+
+        c.setFont("Helvetica", 12)
+        c.setFillColor(colors.black)
+        c.drawCentredString(width / 2.0, height - 70, self.company_address)
+        c.drawCentredString(width / 2.0, height - 90, self.contact)
+        c.drawString(30, height - 110, self.gstin)
+
+        # Customer labels
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(30, height - 180, "Customer Name: ")
+        c.drawString(30, height - 200, "Mobile Number: ")
+        c.drawString(30, height - 220, "Place: ")
+        c.drawString(30, height - 240, "Address: ")
+
+        # Bank details and signature along the bottom of the page
+        c.setFont("Helvetica", 12)
+        for i, detail in enumerate(self.bank_details):
+            c.drawString(30, LETTERHEAD_FOOTER_TOP - (i * 20), detail)
+        c.drawRightString(width - 30, LETTERHEAD_FOOTER_TOP, f"For {self.company_name}")
+        c.drawRightString(width - 60, LETTERHEAD_FOOTER_TOP - 60, "Seal and Signature")
+
+
+_letterhead_cache = {}
+
+
+def get_letterhead(config):
+    """Return the cached Letterhead for a config, building it on first use"""
+    key = json.dumps([config.get(k) for k in LETTERHEAD_KEYS], sort_keys=True)
+    letterhead = _letterhead_cache.get(key)
+    if letterhead is None:
+        letterhead = _letterhead_cache[key] = Letterhead(config)
+    return letterhead
+
+
+def invalidate_letterhead():
+    """Drop cached letterheads after the company settings change"""
+    _letterhead_cache.clear()
+
+
+def invoice_qr_data(record, config):
+    """Text encoded in the QR code of an invoice"""
+    return f"""
+        Company: {config['company_name']}
+        Invoice No: {format_invoice_number(record['invoice_number'], record.get('series', ''))}
+        Date: {record['date']}
+        Customer: {record['customer']['name']}
+        Total: {record['total']:.2f}
+        """
+
+
+def make_qr(data, box_size=4):
+    """Encode data as a QR code, shared by the PDF and the on-screen QR window"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def draw_qr(c, qr, x, y, size):
+    """Draw a QR code as vector rectangles, without an intermediate image"""
+    matrix = qr.get_matrix()
+    module = size / len(matrix)
+    c.saveState()
+    c.setFillColor(colors.black)
+    for row, modules in enumerate(matrix):
+        row_y = y + size - (row + 1) * module
+        col = 0
+        while col < len(modules):
+            if not modules[col]:
+                col += 1
+                continue
+            # One rectangle per run of dark modules
+            start = col
+            while col < len(modules) and modules[col]:
+                col += 1
+            c.rect(x + start * module, row_y, (col - start) * module, module, stroke=0, fill=1)
+    c.restoreState()
+
+
+# Top of the line item area, below the invoice and customer details
+INVOICE_BODY_TOP = 275
+
+
+class _QRCodeFlowable(Flowable):
+    """Square QR code drawn with draw_qr()"""
+
+    def __init__(self, qr, size):
+        Flowable.__init__(self)
+        self.qr = qr
+        self.width = self.height = size
+
+    def draw(self):
+        draw_qr(self.canv, self.qr, 0, 0, self.width)
+
+
+class _ItemsTable(LongTable):
+    """Line item table. Split parts keep this class, which lets the document
+    count how many rows ended up on each page."""
+
+
+class InvoiceDocTemplate(BaseDocTemplate):
+    """A4 invoice document with the letterhead and invoice details on every page.
+
+    The line item table flows over as many pages as it needs with its header
+    row repeated, and the running subtotal is carried forward at every page
+    break.
+    """
+
+    def __init__(self, file_path, record, config):
+        BaseDocTemplate.__init__(
+            self,
+            file_path,
+            pagesize=A4,
+            leftMargin=30,
+            rightMargin=30,
+            topMargin=INVOICE_BODY_TOP,
+            bottomMargin=LETTERHEAD_FOOTER_TOP + 30,
+            title=f"Invoice {format_invoice_number(record['invoice_number'], record.get('series', ''))}"
+        )
+        self.record = record
+        self.letterhead = get_letterhead(config)
+
+        # Running subtotal after each line, in paise
+        self.running_totals = [0]
+        for item in record["items"]:
+            self.running_totals.append(self.running_totals[-1] + to_paise(item[5]))
+        self.rows_done = 0
+
+        frame = Frame(
+            self.leftMargin, self.bottomMargin, self.width, self.height,
+            leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0,
+            id="body"
+        )
+        self.addPageTemplates([
+            PageTemplate(id="invoice", frames=[frame], onPage=self._on_page, onPageEnd=self._on_page_end)
+        ])
+
+    def _items_in_progress(self):
+        return 0 < self.rows_done < len(self.record["items"])
+
+    def afterFlowable(self, flowable):
+        if isinstance(flowable, _ItemsTable):
+            # Every part starts with the (repeated) header row
+            self.rows_done += len(flowable._cellvalues) - 1
+
+    def _on_page(self, c, doc):
+        width, height = self.pagesize
+        record = self.record
+        self.letterhead.draw(c, width, height)
+
+        # Invoice details
+        c.setFont("Helvetica", 12)
+        c.setFillColor(colors.black)
+        c.drawRightString(width - 30, height - 110, f"Date: {record['date']}")
+        c.drawRightString(
+            width - 30, height - 130,
+            f"Invoice No: {format_invoice_number(record['invoice_number'], record.get('series', ''))}"
+        )
+        c.drawRightString(width - 30, height - 150, f"Bill Type: {record['bill_type']}")
+
+        # Customer info
+        customer = record["customer"]
+        c.drawString(150, height - 180, customer["name"])
+        c.drawString(150, height - 200, customer["mobile"])
+        c.drawString(150, height - 220, customer["place"])
+        c.drawString(150, height - 240, customer["address"])
+
+        c.setFont("Helvetica", 10)
+        c.drawRightString(width - 30, height - 170, f"Page {c.getPageNumber()}")
+        if self._items_in_progress():
+            brought_forward = paise_to_rupees(self.running_totals[self.rows_done])
+            c.drawRightString(width - 30, height - INVOICE_BODY_TOP + 8, f"Brought forward: {brought_forward:.2f}")
+
+    def _on_page_end(self, c, doc):
+        if self._items_in_progress():
+            width = self.pagesize[0]
+            carried_forward = paise_to_rupees(self.running_totals[self.rows_done])
+            c.setFont("Helvetica-Bold", 10)
+            c.setFillColor(colors.black)
+            c.drawRightString(width - 30, self.bottomMargin - 14, f"Carried forward: {carried_forward:.2f}")
+
+
+def invoice_story(record, config):
+    """Flowables for the variable part of an invoice"""
+    primary_color = colors.HexColor(config["primary_color"])
+    accent_color = colors.HexColor(config["accent_color"])
+
+    # Table header
+    table_data = [
+        ["S.No", "HSN", "Product Description", "Price", "Quantity", "Total"]
+    ]
+
+    # Table data
+    for sno, hsn, description, price, quantity, total in record["items"]:
+        table_data.append([str(sno), hsn, description, f"{price:.2f}", quantity, f"{total:.2f}"])
+
+    # Create table
+    table = _ItemsTable(table_data, colWidths=[40, 80, 250, 60, 60, 60], repeatRows=1, hAlign="LEFT")
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), primary_color),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('GRID', (0, 0), (-1, -1), 1, colors.lightgrey),
+        ('ALIGN', (2, 1), (2, -1), 'LEFT'),  # Product description left-aligned
+        ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),  # Numbers right-aligned
+    ]))
+
+    # Create totals table
+    totals_data = [
+        ["Subtotal:", f"{record['subtotal']:.2f}"],
+        # [f"SGST ({config['tax_rates']['sgst']}%):", f"{record['sgst']:.2f}"],
+        # [f"IGST ({config['tax_rates']['igst']}%):", f"{record['igst']:.2f}"],
+        ["Roundoff:", f"{record['roundoff']:.2f}"],
+        ["Grand Total:", f"{record['total']:.2f}"]
+    ]
+
+    totals_table = Table(totals_data, colWidths=[150, 100], hAlign="RIGHT")
+    totals_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('TEXTCOLOR', (0, -1), (-1, -1), accent_color),
+        ('FONTSIZE', (0, -1), (-1, -1), 14),
+        ('LINEABOVE', (0, 0), (-1, 0), 1, colors.lightgrey),
+        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+    ]))
+
+    # Amount in words
+    styles = getSampleStyleSheet()
+    styleN = styles['Normal']
+    styleN.wordWrap = 'CJK'
+    words = Paragraph(f"<b>Amount in words:</b> {amount_in_words(to_paise(record['total']))}", styleN)
+
+    closing = [totals_table, Spacer(1, 10), words]
+
+    # QR Code
+    try:
+        closing += [Spacer(1, 10), _QRCodeFlowable(make_qr(invoice_qr_data(record, config)), 80)]
+    except Exception as e:
+        print(f"Error generating QR code: {e}")
+
+    return [table, Spacer(1, 20), KeepTogether(closing)]
+
+
+def render_invoice_pdf(record, config, file_path):
+    """Render an invoice record to a PDF file.
+
+    ``record`` is a plain dict as returned by BillingSystem.snapshot_invoice()
+    or load_invoice_record(), so this can run without any Tk widgets, e.g. in
+    a worker process.
+    """
+    InvoiceDocTemplate(file_path, record, config).build(invoice_story(record, config))
+
+
+def invoice_pdf_filename(record):
+    """Default file name for an invoice PDF"""
+    series = f"{record['series']}_" if record.get("series") else ""
+    return f"Invoice_{series}{record['invoice_number']:04d}_{record['date'].replace('-', '')}.pdf"
+
+
+# Invoice numbers can restart every financial year, which runs from April
+FINANCIAL_YEAR_START_MONTH = 4
+
+
+def financial_year(date):
+    """Financial year of a dd-mm-YYYY or ISO date, such as 2026-27"""
+    day = datetime.strptime(to_iso_date(date), "%Y-%m-%d")
+    start = day.year if day.month >= FINANCIAL_YEAR_START_MONTH else day.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+def format_invoice_number(number, series=""):
+    """Invoice number as printed, prefixed with its series if it has one"""
+    return f"{series}/{number:04d}" if series else f"{number:04d}"
+
+
+# Dates are shown and entered as dd-mm-YYYY but stored as ISO YYYY-MM-DD,
+# which sorts correctly and lets date ranges use idx_invoices_date
+DISPLAY_DATE_FORMAT = "%d-%m-%Y"
+ISO_DATE_FORMAT = "%Y-%m-%d"
+
+
+def to_iso_date(date):
+    """Convert a dd-mm-YYYY date to YYYY-MM-DD; ISO dates are returned as is"""
+    try:
+        return datetime.strptime(date, DISPLAY_DATE_FORMAT).strftime(ISO_DATE_FORMAT)
+    except ValueError:
+        return datetime.strptime(date, ISO_DATE_FORMAT).strftime(ISO_DATE_FORMAT)
+
+
+def to_display_date(date):
+    """Convert a stored YYYY-MM-DD date to dd-mm-YYYY; anything else is returned as is"""
+    try:
+        return datetime.strptime(date, ISO_DATE_FORMAT).strftime(DISPLAY_DATE_FORMAT)
+    except (TypeError, ValueError):
+        return date or ""
+
+
+def connect_database(db_file, timeout=5.0, read_only=False):
+    """Open a tuned connection to the billing database with foreign keys enforced.
+
+    Connections may be handed between threads, but Database makes sure only
+    one thread uses a connection at a time.
+    """
+    if read_only:
+        uri = f"{Path(db_file).absolute().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=timeout, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_file, timeout=timeout, check_same_thread=False)
+    conn.execute("PRAGMA foreign_keys = ON")
+    # With WAL, NORMAL only syncs at checkpoints; a power cut may lose the
+    # last commits but cannot corrupt the database
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -16000")  # 16 MB page cache
+    conn.execute("PRAGMA mmap_size = 268435456")  # 256 MB
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+class Database:
+    """Connections to the billing database: one locked writer and a pool of read-only readers.
+
+    Use db.write() for a transaction and db.read() for queries; worker
+    threads pass background=True.
+    """
+
+    def __init__(self, db_file, readers=3, background_readers=6, timeout=10.0):
+        self.db_file = os.path.abspath(db_file)
+        self.timeout = timeout
+        self._write_lock = threading.RLock()
+        self._pool_lock = threading.Lock()
+        self._readers = threading.Semaphore(readers)
+        # Searches, reports, backups and exports hold their connection for a
+        # long time; they get slots of their own so the UI never waits on them
+        self._background_readers = threading.Semaphore(background_readers)
+        self._idle = []
+        self._generation = 0
+        self._writer = None
+        # Bumped by every commit, so views can tell whether to reload
+        self.write_sequence = 0
+        self.open()
+
+    def open(self):
+        """Open the writer connection and bring the schema up to date"""
+        with self._write_lock:
+            self.close()
+            self._writer = connect_database(self.db_file, self.timeout)
+            self._writer.execute("PRAGMA journal_mode = WAL")
+            try:
+                migrate_database(self._writer)
+            except BaseException:
+                self.close()
+                raise
+
+    def close(self):
+        """Close all connections; readers still in use are closed when released"""
+        with self._write_lock:
+            with self._pool_lock:
+                self._generation += 1
+                idle, self._idle = self._idle, []
+            for conn in idle:
+                conn.close()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def restore(self, backup_file):
+        """Replace the contents of the database with backup_file.
+
+        The backup is copied next to the live database, checked and migrated
+        there first; only a valid, up to date copy is then written into the
+        live database, in a single write transaction. Readers here and in
+        other processes keep the state they started with until they finish.
+        """
+        staged_file = self.db_file + ".restore"
+        if os.path.exists(staged_file):
+            os.remove(staged_file)
+
+        source = sqlite3.connect(f"{Path(backup_file).absolute().as_uri()}?mode=ro", uri=True)
+        staged = sqlite3.connect(staged_file)
+        try:
+            # The backup API also copies backups that are in WAL mode correctly
+            source.backup(staged)
+            source.close()
+
+            result = staged.execute("PRAGMA integrity_check").fetchone()[0]
+            if result != "ok":
+                raise sqlite3.DatabaseError(f"The backup is damaged: {result}")
+            version = staged.execute("PRAGMA user_version").fetchone()[0]
+            if version > len(MIGRATIONS):
+                raise sqlite3.DatabaseError("The backup was made by a newer version of the application")
+            tables = {row[0] for row in staged.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if not {"invoices", "invoice_items"} <= tables:
+                raise sqlite3.DatabaseError("The file is not a billing database backup")
+
+            migrate_database(staged)
+            staged.execute("PRAGMA journal_mode = DELETE")
+
+            with self._write_lock:
+                if self._writer is None:
+                    raise sqlite3.ProgrammingError("The database is closed")
+                # A database in WAL mode cannot change its page size, so copy
+                # pages of the size the live database already uses
+                page_size = self._writer.execute("PRAGMA page_size").fetchone()[0]
+                if staged.execute("PRAGMA page_size").fetchone()[0] != page_size:
+                    staged.execute(f"PRAGMA page_size = {page_size}")
+                    staged.execute("VACUUM")
+                staged.backup(self._writer)
+                self.write_sequence += 1
+        finally:
+            source.close()
+            staged.close()
+            os.remove(staged_file)
+
+    def data_version(self):
+        """A value that changes whenever the database is written, here or by another process"""
+        with self._write_lock:
+            if self._writer is None:
+                raise sqlite3.ProgrammingError("The database is closed")
+            # PRAGMA data_version only moves for commits on other connections
+            return self.write_sequence, self._writer.execute("PRAGMA data_version").fetchone()[0]
+
+    @contextmanager
+    def write(self):
+        """The writer connection for one transaction, committed on success"""
+        with self._write_lock:
+            if self._writer is None:
+                raise sqlite3.ProgrammingError("The database is closed")
+            try:
+                yield self._writer
+                self._writer.commit()
+                self.write_sequence += 1
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    @contextmanager
+    def read(self, background=False):
+        """A read-only connection from the pool; background for worker threads"""
+        with self._background_readers if background else self._readers:
+            with self._pool_lock:
+                generation = self._generation
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = connect_database(self.db_file, self.timeout, read_only=True)
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                with self._pool_lock:
+                    if generation == self._generation:
+                        self._idle.append(conn)
+                        conn = None
+                # Reopened since this connection was handed out
+                if conn is not None:
+                    conn.close()
+
+
+@contextmanager
+def interruptible(conn, cancelled, steps=1000):
+    """Abort the queries run on conn, with OperationalError, once cancelled() is true"""
+    conn.set_progress_handler(cancelled, steps)
+    try:
+        yield conn
+    finally:
+        conn.set_progress_handler(None, steps)
+
+
+def _migrate_base_schema(conn):
+    """Tables of the original schema"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS invoices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_number INTEGER,
+            date TEXT,
+            customer_name TEXT,
+            customer_mobile TEXT,
+            customer_place TEXT,
+            customer_address TEXT,
+            bill_type TEXT,
+            subtotal REAL,
+            sgst REAL,
+            igst REAL,
+            roundoff REAL,
+            total REAL,
+            pdf_path TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id INTEGER,
+            sno INTEGER,
+            hsn TEXT,
+            description TEXT,
+            price REAL,
+            quantity INTEGER,
+            total REAL,
+            FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hsn TEXT UNIQUE,
+            name TEXT,
+            price REAL,
+            category TEXT,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            mobile TEXT UNIQUE,
+            place TEXT,
+            address TEXT,
+            gstin TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _migrate_cascade_invoice_items(conn):
+    """Delete the items of an invoice together with the invoice"""
+    # Items whose invoice is gone can never be shown again
+    conn.execute('''
+        DELETE FROM invoice_items
+        WHERE invoice_id IS NULL
+           OR invoice_id NOT IN (SELECT id FROM invoices)
+    ''')
+
+    # SQLite cannot alter a foreign key, so rebuild the table
+    conn.execute('''
+        CREATE TABLE invoice_items_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id INTEGER NOT NULL,
+            sno INTEGER,
+            hsn TEXT,
+            description TEXT,
+            price REAL,
+            quantity INTEGER,
+            total REAL,
+            FOREIGN KEY (invoice_id) REFERENCES invoices (id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO invoice_items_new (id, invoice_id, sno, hsn, description, price, quantity, total)
+        SELECT id, invoice_id, sno, hsn, description, price, quantity, total FROM invoice_items
+    ''')
+    conn.execute("DROP TABLE invoice_items")
+    conn.execute("ALTER TABLE invoice_items_new RENAME TO invoice_items")
+    if conn.execute("PRAGMA foreign_key_check(invoice_items)").fetchone():
+        raise sqlite3.IntegrityError("invoice_items has items without an invoice")
+
+
+def _migrate_indexes(conn):
+    """Unique invoice numbers and indexes for the lookups and reports"""
+    # Older versions could hand out the same number twice. Those numbers are
+    # on printed bills, so leave it to the user to sort them out
+    duplicates = conn.execute('''
+        SELECT invoice_number, COUNT(*) FROM invoices
+        GROUP BY invoice_number
+        HAVING COUNT(*) > 1
+        ORDER BY invoice_number
+    ''').fetchall()
+    if duplicates:
+        listed = ", ".join(f"{number} ({count} invoices)" for number, count in duplicates[:20])
+        if len(duplicates) > 20:
+            listed += f" and {len(duplicates) - 20} more"
+        raise sqlite3.IntegrityError(f"Invoice numbers used more than once: {listed}")
+
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_number ON invoices(invoice_number)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_customer ON invoices(customer_mobile)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items(invoice_id, sno)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoice_items_hsn ON invoice_items(hsn)")
+
+    # products.hsn is UNIQUE and already has an index of its own
+    conn.execute("DROP INDEX IF EXISTS idx_products_hsn")
+
+
+def _migrate_iso_dates(conn):
+    """Store invoice dates as YYYY-MM-DD instead of dd-mm-YYYY"""
+    conn.execute('''
+        UPDATE invoices
+        SET date = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2)
+        WHERE date GLOB '[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]'
+    ''')
+
+
+def _migrate_invoice_sequences(conn):
+    """Issue invoice numbers from a sequence table, optionally per financial year"""
+    conn.execute("ALTER TABLE invoices ADD COLUMN series TEXT NOT NULL DEFAULT ''")
+    conn.execute("DROP INDEX IF EXISTS idx_invoices_number")
+    conn.execute("CREATE UNIQUE INDEX idx_invoices_number ON invoices(invoice_number, series)")
+    conn.execute('''
+        CREATE TABLE invoice_sequences (
+            series TEXT PRIMARY KEY,
+            last_number INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    sync_invoice_sequences(conn)
+
+
+# Full-text search: the FTS5 index of each searchable table, the columns it
+# indexes with their bm25 weights, and the columns search results return
+SEARCH_TABLES = {
+    "products": {
+        "index": "products_fts",
+        "columns": {"hsn": 5.0, "name": 10.0, "category": 2.0},
+        "select": ("id", "hsn", "name", "price", "category", "last_updated"),
+    },
+    "customers": {
+        "index": "customers_fts",
+        "columns": {"name": 10.0, "mobile": 5.0, "place": 3.0, "address": 1.0, "gstin": 5.0},
+        "select": ("id", "name", "mobile", "place", "address", "gstin", "created_at"),
+    },
+    "invoices": {
+        "index": "invoices_fts",
+        "columns": {
+            "invoice_number": 10.0, "customer_name": 8.0, "customer_mobile": 5.0,
+            "customer_place": 3.0, "customer_address": 1.0, "items": 2.0
+        },
+        "select": ("id", "invoice_number", "date", "customer_name", "customer_mobile", "total"),
+    },
+}
+
+FTS_OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+# Text of the line items of invoice {id}, indexed with the invoice
+INVOICE_ITEMS_TEXT = "(SELECT group_concat(description, ' ') FROM invoice_items WHERE invoice_id = {id})"
+
+
+def _fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _create_content_index(conn, table):
+    """FTS5 index over a table's own columns, kept in step by triggers"""
+    index = SEARCH_TABLES[table]["index"]
+    columns = list(SEARCH_TABLES[table]["columns"])
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE {index} USING fts5(
+            {column_list}, content = '{table}', content_rowid = 'id', {FTS_OPTIONS}
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER {index}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER {index}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER {index}_update AFTER UPDATE OF id, {column_list} ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {index} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    """)
+
+
+def _create_invoice_index(conn):
+    """FTS5 index over invoices and the descriptions of their items (see index_invoice_items)"""
+    columns = [column for column in SEARCH_TABLES["invoices"]["columns"] if column != "items"]
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    conn.execute(f"CREATE VIRTUAL TABLE invoices_fts USING fts5({column_list}, items, {FTS_OPTIONS})")
+    insert = f"""
+        INSERT INTO invoices_fts (rowid, {column_list}, items)
+        VALUES (new.id, {new_values}, {INVOICE_ITEMS_TEXT.format(id="new.id")});
+    """
+    conn.execute(f"CREATE TRIGGER invoices_fts_insert AFTER INSERT ON invoices BEGIN {insert} END")
+    conn.execute("""
+        CREATE TRIGGER invoices_fts_delete AFTER DELETE ON invoices BEGIN
+            DELETE FROM invoices_fts WHERE rowid = old.id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER invoices_fts_update AFTER UPDATE OF id, {column_list} ON invoices BEGIN
+            DELETE FROM invoices_fts WHERE rowid = old.id;
+            {insert}
+        END
+    """)
+
+
+def index_invoice_items(conn, invoice_ids=None):
+    """Index the item descriptions of invoices once their items are written, or of all invoices"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'invoices_fts'").fetchone() is None:
+        return
+    if invoice_ids is None:
+        conn.execute(f"UPDATE invoices_fts SET items = {INVOICE_ITEMS_TEXT.format(id='invoices_fts.rowid')}")
+    else:
+        conn.executemany(
+            f"UPDATE invoices_fts SET items = {INVOICE_ITEMS_TEXT.format(id='?1')} WHERE rowid = ?1",
+            ((invoice_id,) for invoice_id in invoice_ids)
+        )
+
+
+def rebuild_search_indexes(conn):
+    """Fill the full-text indexes again from the tables they index"""
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO customers_fts (customers_fts) VALUES ('rebuild')")
+    columns = ", ".join(column for column in SEARCH_TABLES["invoices"]["columns"] if column != "items")
+    conn.execute("DELETE FROM invoices_fts")
+    conn.execute(f"""
+        INSERT INTO invoices_fts (rowid, {columns}, items)
+        SELECT id, {columns}, {INVOICE_ITEMS_TEXT.format(id="invoices.id")} FROM invoices
+    """)
+
+
+def _migrate_full_text_search(conn):
+    """Full-text indexes for searching products, customers and invoices"""
+    # Without FTS5 in this SQLite build, search_records falls back to LIKE
+    if not _fts5_available(conn):
+        return
+    _create_content_index(conn, "products")
+    _create_content_index(conn, "customers")
+    _create_invoice_index(conn)
+    rebuild_search_indexes(conn)
+
+
+# Daily totals the Reports tab reads instead of scanning every invoice line.
+# A customer is keyed by mobile, or by name when there is no mobile.
+CUSTOMER_KEY = "COALESCE(NULLIF(customer_mobile, ''), customer_name, '')"
+
+
+def rebuild_sales_rollups(conn):
+    """Compute the daily sales totals again from invoices and invoice_items"""
+    conn.execute("DELETE FROM sales_daily")
+    conn.execute("DELETE FROM sales_daily_hsn")
+    conn.execute("DELETE FROM sales_daily_customer")
+    conn.execute('''
+        INSERT INTO sales_daily (date, bill_type, invoices, subtotal, sgst, igst, total)
+        SELECT date, COALESCE(bill_type, ''), COUNT(*), TOTAL(subtotal), TOTAL(sgst), TOTAL(igst), TOTAL(total)
+        FROM invoices
+        WHERE date IS NOT NULL
+        GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO sales_daily_hsn (date, hsn, quantity, total)
+        SELECT i.date, COALESCE(ii.hsn, ''), TOTAL(ii.quantity), TOTAL(ii.total)
+        FROM invoice_items ii
+        JOIN invoices i ON i.id = ii.invoice_id
+        WHERE i.date IS NOT NULL
+        GROUP BY 1, 2
+    ''')
+    # The bare name column comes from the latest invoice, the one with MAX(id)
+    conn.execute(f'''
+        INSERT INTO sales_daily_customer (date, customer, name, invoices, total)
+        SELECT date, customer, name, invoices, total FROM (
+            SELECT date, {CUSTOMER_KEY} AS customer, customer_name AS name,
+                   COUNT(*) AS invoices, TOTAL(total) AS total, MAX(id)
+            FROM invoices
+            WHERE date IS NOT NULL
+            GROUP BY 1, 2
+        )
+    ''')
+
+
+def _migrate_sales_rollups(conn):
+    """Daily sales totals by bill type, HSN and customer"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            date TEXT NOT NULL,
+            bill_type TEXT NOT NULL,
+            invoices INTEGER NOT NULL,
+            subtotal REAL NOT NULL,
+            sgst REAL NOT NULL,
+            igst REAL NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (date, bill_type)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily_hsn (
+            date TEXT NOT NULL,
+            hsn TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (date, hsn)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily_customer (
+            date TEXT NOT NULL,
+            customer TEXT NOT NULL,
+            name TEXT,
+            invoices INTEGER NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (date, customer)
+        ) WITHOUT ROWID
+    ''')
+    rebuild_sales_rollups(conn)
+
+
+def _migrate_invoice_items_text(conn):
+    """Index item text once per invoice instead of from a trigger per item"""
+    # Each item trigger re-indexed all items of its invoice, O(n²) per invoice
+    for event in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS invoice_items_fts_{event}")
+
+
+# Schema migrations in the order they are applied. PRAGMA user_version holds
+# the number of migrations a database has had, so only append to this list.
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_cascade_invoice_items,
+    _migrate_indexes,
+    _migrate_iso_dates,
+    _migrate_invoice_sequences,
+    _migrate_full_text_search,
+    _migrate_sales_rollups,
+    _migrate_invoice_items_text,
+]
+
+
+def migrate_database(conn):
+    """Bring the database schema up to date, one transaction per migration"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > len(MIGRATIONS):
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this version of the application"
+        )
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Table rebuilds need foreign keys off; this has no effect inside a transaction
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another instance may have migrated while this one waited for the lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] < number:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA foreign_keys = ON")
+
+
+def full_text_query(text):
+    """FTS5 query matching rows that have every word of text as a prefix"""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text.lower()))
+
+
+def search_records(conn, table, text, after=None, limit=100):
+    """One page of the rows of a SEARCH_TABLES table that match text.
+
+    Every word of text must start a word in one of the indexed columns;
+    invoices also match on the descriptions of their items. Rows are ranked
+    with bm25 using the table's FTS5 index, or found with LIKE in id order in
+    a database without one. Empty text matches every row, in id order.
+
+    Pages use keyset pagination: pass the key returned with one page as
+    after to get the next. Returns (rows, key); key is None after the last
+    page.
+    """
+    source = SEARCH_TABLES[table]
+    index = source["index"]
+    select = ", ".join(f"t.{column}" for column in source["select"])
+    query = full_text_query(text)
+
+    if query and conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (index,)).fetchone():
+        weights = ", ".join(str(weight) for weight in source["columns"].values())
+        rows = conn.execute(f"""
+            SELECT * FROM (
+                SELECT {select}, bm25({index}, {weights}) AS score
+                FROM {index} JOIN {table} t ON t.id = {index}.rowid
+                WHERE {index} MATCH ?
+            )
+            WHERE (score, id) > (?, ?)
+            ORDER BY score, id
+            LIMIT ?
+        """, (query, *(after or (float("-inf"), 0)), limit)).fetchall()
+        key = (rows[-1][-1], rows[-1][0]) if len(rows) == limit else None
+        return [row[:-1] for row in rows], key
+
+    conditions = ["t.id > ?"]
+    params = [after or 0]
+    expressions = [
+        INVOICE_ITEMS_TEXT.format(id="t.id") if column == "items" else f"t.{column}"
+        for column in source["columns"]
+    ]
+    for word in re.findall(r"\w+", text.lower()):
+        conditions.append("(" + " OR ".join(f"{expression} LIKE ?" for expression in expressions) + ")")
+        params.extend([f"%{word}%"] * len(expressions))
+    rows = conn.execute(
+        f"SELECT {select} FROM {table} t WHERE {' AND '.join(conditions)} ORDER BY t.id LIMIT ?",
+        (*params, limit)
+    ).fetchall()
+    return rows, (rows[-1][0] if len(rows) == limit else None)
+
+
+def find_invoices(conn, column, value, after=None, limit=100):
+    """One page of the invoices whose number equals, or whose column contains,
+    value, newest first. Pages work as in search_records."""
+    if column == "invoice_number" and value.isdigit():
+        # Exact lookup on the unique invoice number index
+        condition, param = "invoice_number = ?", int(value)
+    else:
+        condition, param = f"{column} LIKE ?", f"%{value}%"
+    rows = conn.execute(f"""
+        SELECT id, invoice_number, date, customer_name, customer_mobile, total
+        FROM invoices
+        WHERE {condition} AND (date, id) < (?, ?)
+        ORDER BY date DESC, id DESC
+        LIMIT ?
+    """, (param, *(after or ("\uffff", 0)), limit)).fetchall()
+    return rows, ((rows[-1][2], rows[-1][0]) if len(rows) == limit else None)
+
+
+BACKUP_PREFIX = "billing_backup_"
+
+
+class BackupService:
+    """Online backups of the billing database with the SQLite backup API.
+
+    run_async and schedule put (path, error) on results for the UI to pick up.
+    """
+
+    def __init__(self, db, pages=256, step_delay=0.005):
+        self.db = db
+        self.pages = pages
+        self.step_delay = step_delay
+        self.results = queue.Queue()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def backup(self, target_file):
+        """Copy the live database to target_file and verify the copy"""
+        with self._lock:
+            temp_file = target_file + ".part"
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            dest = sqlite3.connect(temp_file)
+            try:
+                with self.db.read(background=True) as source:
+                    # Every step copies from this one read transaction
+                    source.execute("BEGIN")
+                    source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                    # Pause between steps to leave the disk to the application
+                    source.backup(
+                        dest,
+                        pages=self.pages,
+                        progress=lambda status, remaining, total: time.sleep(self.step_delay)
+                    )
+                # A backup should be a single self-contained file
+                dest.execute("PRAGMA journal_mode = DELETE")
+                result = dest.execute("PRAGMA integrity_check").fetchone()[0]
+            except Exception:
+                dest.close()
+                os.remove(temp_file)
+                raise
+            dest.close()
+
+            if result != "ok":
+                os.remove(temp_file)
+                raise sqlite3.DatabaseError(f"Backup failed the integrity check: {result}")
+            os.replace(temp_file, target_file)
+            return target_file
+
+    @staticmethod
+    def list_backups(folder):
+        """Backups in folder, oldest first"""
+        if not os.path.isdir(folder):
+            return []
+        names = sorted(
+            name for name in os.listdir(folder)
+            if name.startswith(BACKUP_PREFIX) and name.endswith(".db")
+        )
+        return [os.path.join(folder, name) for name in names]
+
+    def backup_generation(self, folder, generations):
+        """Write a new timestamped backup to folder and remove the oldest ones
+        so that at most ``generations`` are kept"""
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{BACKUP_PREFIX}{datetime.now():%Y%m%d_%H%M%S}.db")
+        self.backup(path)
+        for old_backup in self.list_backups(folder)[:-generations]:
+            os.remove(old_backup)
+        return path
+
+    def run_async(self, target_file):
+        """Back up to target_file on a background thread"""
+        def run():
+            try:
+                self.results.put((self.backup(target_file), None))
+            except Exception as e:
+                self.results.put((target_file, e))
+        threading.Thread(target=run, daemon=True).start()
+
+    def schedule(self, folder, interval_hours, generations, delay=None):
+        """Back up to folder every interval_hours.
+
+        Without a delay the first backup is due one interval after the newest
+        backup already in the folder, but not sooner than a minute from now.
+        """
+        self.cancel()
+        interval = interval_hours * 3600
+        if delay is None:
+            backups = self.list_backups(folder)
+            age = datetime.now().timestamp() - os.path.getmtime(backups[-1]) if backups else interval
+            delay = max(60, interval - age)
+
+        def run():
+            try:
+                self.results.put((self.backup_generation(folder, generations), None))
+            except Exception as e:
+                self.results.put((folder, e))
+            self.schedule(folder, interval_hours, generations, delay=interval)
+
+        self._timer = threading.Timer(delay, run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def cancel(self):
+        """Stop scheduled backups"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+class _CsvExport:
+    """One CSV file per table, next to the chosen file name"""
+
+    def __init__(self, file_path):
+        self.stem = os.path.splitext(file_path)[0]
+        self.file = None
+
+    def begin_table(self, table, columns, types):
+        self.file = open(f"{self.stem}_{table}.csv", "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def end_table(self):
+        self.file.close()
+        self.file = None
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class _XlsxExport:
+    """One sheet per table in a write-only workbook, which keeps rows on disk.
+    Tables longer than a sheet continue on numbered sheets."""
+
+    MAX_ROWS = 1048576
+
+    def __init__(self, file_path):
+        from openpyxl import Workbook
+        self.file_path = file_path
+        self.workbook = Workbook(write_only=True)
+
+    def _new_sheet(self):
+        self.part += 1
+        suffix = "" if self.part == 1 else f" ({self.part})"
+        self.sheet = self.workbook.create_sheet(title=self.table[:31 - len(suffix)] + suffix)
+        self.sheet.append(self.columns)
+        self.sheet_rows = 1
+
+    def begin_table(self, table, columns, types):
+        self.table = table
+        self.columns = columns
+        self.part = 0
+        self._new_sheet()
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self.sheet_rows == self.MAX_ROWS:
+                self._new_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def end_table(self):
+        pass
+
+    def close(self):
+        self.workbook.save(self.file_path)
+
+
+class _ParquetExport:
+    """One Parquet file per table, written a row group per chunk"""
+
+    def __init__(self, file_path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs the pyarrow package")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.stem = os.path.splitext(file_path)[0]
+        self.writer = None
+
+    def _arrow_type(self, declared):
+        # SQLite type affinity rules
+        declared = (declared or "").upper()
+        if "INT" in declared:
+            return self.pa.int64()
+        if any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+            return self.pa.float64()
+        return self.pa.string()
+
+    def begin_table(self, table, columns, types):
+        self.schema = self.pa.schema([
+            (column, self._arrow_type(declared)) for column, declared in zip(columns, types)
+        ])
+        self.writer = self.pq.ParquetWriter(f"{self.stem}_{table}.parquet", self.schema)
+
+    def write_rows(self, rows):
+        arrays = []
+        for field, values in zip(self.schema, zip(*rows)):
+            if field.type == self.pa.string():
+                # Text columns can hold numbers that were imported from Excel
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(self.pa.array(values, type=field.type))
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def end_table(self):
+        self.writer.close()
+        self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+EXPORT_WRITERS = {
+    ".csv": _CsvExport,
+    ".xlsx": _XlsxExport,
+    ".parquet": _ParquetExport,
+}
+
+
+def _export_query(conn, table, since, until):
+    """Query for the rows of a table to export, or None to skip the table.
+
+    since and until map tables to the last id of an export. An incremental
+    export (since is set) takes the rows of tables with a created_at column
+    whose id is in (since, until]; invoice items go with their invoice, and
+    other tables are left out. Ids only grow, unlike created_at, which
+    several commits can share within its one-second resolution.
+    """
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+    if since is None:
+        return f'SELECT * FROM "{table}"', ()
+    if "created_at" in columns and table in until:
+        return f'SELECT * FROM "{table}" WHERE id > ? AND id <= ?', (since.get(table, 0), until[table])
+    if table == "invoice_items":
+        return '''
+            SELECT * FROM invoice_items
+            WHERE invoice_id > ? AND invoice_id <= ?
+        ''', (since.get("invoices", 0), until["invoices"])
+    return None
+
+
+def export_database(db, file_path, since=None, chunksize=5000, progress=None):
+    """Stream the database tables to file_path in chunks of rows.
+
+    The format follows the file extension (.xlsx, .csv or .parquet; CSV and
+    Parquet write one file per table). Only ``chunksize`` rows are held in
+    memory at a time, and all tables are read from one snapshot. progress is
+    called as progress(table, rows_done, rows_total). Returns the time of
+    the snapshot and the {table: last id} to pass as ``since`` to the next
+    incremental export.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in EXPORT_WRITERS:
+        raise ValueError(f"Cannot export to {extension or 'a file without extension'}")
+
+    with db.read(background=True) as conn:
+        conn.execute("BEGIN")
+        exported_at = conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+        rows = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+        # Full-text indexes and their shadow tables are rebuilt from the data
+        virtual = [name for name, sql in rows if sql.upper().startswith("CREATE VIRTUAL TABLE")]
+        tables = [
+            name for name, sql in rows
+            if not any(name == index or name.startswith(f"{index}_") for index in virtual)
+        ]
+
+        # The last id of every table with one, read from the same snapshot
+        until = {
+            table: conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{table}"').fetchone()[0]
+            for table in tables
+            if any(row[1] == "id" for row in conn.execute(f'PRAGMA table_info("{table}")'))
+        }
+
+        exports = []
+        rows_total = 0
+        for table in tables:
+            query = _export_query(conn, table, since, until)
+            if query is not None:
+                exports.append((table, *query))
+                rows_total += conn.execute(f"SELECT COUNT(*) FROM ({query[0]})", query[1]).fetchone()[0]
+
+        writer = EXPORT_WRITERS[extension](file_path)
+        rows_done = 0
+        try:
+            for table, query, params in exports:
+                types = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+                cursor = conn.execute(query, params)
+                columns = [column[0] for column in cursor.description]
+                writer.begin_table(table, columns, [types.get(column) for column in columns])
+                while True:
+                    rows = cursor.fetchmany(chunksize)
+                    if not rows:
+                        break
+                    writer.write_rows(rows)
+                    rows_done += len(rows)
+                    if progress:
+                        progress(table, rows_done, rows_total)
+                writer.end_table()
+        finally:
+            writer.close()
+    return exported_at, until
+
+
+# Tables that can be imported from Excel, in the order they are applied, with
+# the columns that rows are matched on when merging into existing data.
+# Invoice items are merged with their invoice, replacing the items it had.
+IMPORT_TABLES = {
+    "products": ("hsn",),
+    "customers": ("mobile",),
+    "invoices": ("invoice_number", "series"),
+    "invoice_items": ("invoice_id",),
+}
+
+
+def _import_converter(table, column, declared):
+    """Function that turns a cell value into the value stored in column"""
+    declared = (declared or "").upper()
+    if table == "invoices" and column == "date":
+        def to_date(value):
+            if isinstance(value, datetime):
+                return value.strftime(ISO_DATE_FORMAT)
+            return to_iso_date(str(value).strip())
+        return to_date
+    if "INT" in declared:
+        def to_int(value):
+            number = float(value)
+            if not number.is_integer():
+                raise ValueError("not a whole number")
+            return int(number)
+        return to_int
+    if any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+        return float
+
+    def to_text(value):
+        # Excel turns mobile numbers and HSN codes into numbers
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        return str(value)
+    return to_text
+
+
+@contextmanager
+def _open_workbook(file_path):
+    """(sheet title, row iterator) for each sheet of a workbook.
+
+    python-calamine reads large sheets many times faster than openpyxl and is
+    used when it is installed. Sheets are only read once their rows are
+    iterated.
+    """
+    try:
+        from python_calamine import CalamineWorkbook
+    except ImportError:
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            yield [(sheet.title, sheet.iter_rows(values_only=True)) for sheet in workbook.worksheets]
+        finally:
+            workbook.close()
+        return
+
+    def sheet_rows(name):
+        yield from workbook.get_sheet_by_name(name).iter_rows()
+
+    workbook = CalamineWorkbook.from_path(file_path)
+    yield [(name, sheet_rows(name)) for name in workbook.sheet_names]
+
+
+def _stage_sheets(conn, table, worksheets, mode, batch_size, progress, errors):
+    """Check the rows of a table's sheets and load them into temp.import_<table>.
+    Returns the columns that were staged and the number of rows."""
+    info = {row[1]: row for row in conn.execute(f"PRAGMA table_info({table})")}
+    key = IMPORT_TABLES[table]
+    columns = None
+    count = 0
+
+    for title, rows in worksheets:
+        header = list(next(rows, None) or [])
+        while header and header[-1] in (None, ""):
+            header.pop()
+        header = [str(name).strip() if name is not None else "" for name in header]
+
+        if columns is None:
+            first_header = header
+            unknown = [name for name in header if name not in info]
+            if unknown:
+                raise ValueError(f"Sheet {title}: unknown columns {', '.join(map(repr, unknown))}")
+            if len(set(header)) != len(header):
+                raise ValueError(f"Sheet {title}: a column appears twice")
+            # A key column with a default, such as the invoice series, may be left out
+            missing_keys = [name for name in key if name not in header and info[name][4] is None]
+            if mode == "merge" and missing_keys:
+                raise ValueError(f"Sheet {title}: merging needs the {', '.join(missing_keys)} column")
+
+            # Ids of another database mean nothing when merging; invoice ids
+            # are kept to match the items to their invoice
+            plan = [
+                (index, name, _import_converter(table, name, info[name][2]))
+                for index, name in enumerate(header)
+                if not (mode == "merge" and name == "id" and table != "invoices")
+            ]
+            columns = [name for index, name, convert in plan]
+            required = {
+                name for name, row in info.items()
+                if row[3] and row[4] is None and not row[5]
+            }
+            missing = required - set(columns)
+            if missing:
+                raise ValueError(f"Sheet {title}: missing required columns {', '.join(sorted(missing))}")
+
+            column_list = ", ".join(columns)
+            conn.execute(f"CREATE TEMP TABLE import_{table} AS SELECT {column_list} FROM main.{table} WHERE 0")
+            insert = f"INSERT INTO temp.import_{table} ({column_list}) VALUES ({', '.join('?' * len(columns))})"
+        elif header != first_header:
+            raise ValueError(f"Sheet {title}: columns differ from the first {table} sheet")
+
+        batch = []
+        for number, row in enumerate(rows, start=2):
+            if not row or all(value is None for value in row):
+                continue
+            values = []
+            for index, name, convert in plan:
+                value = row[index] if index < len(row) else None
+                if value is None or (isinstance(value, str) and not value.strip()):
+                    if name in required:
+                        errors.append(f"Sheet {title}, row {number}: {name} is empty")
+                    values.append(None)
+                    continue
+                try:
+                    values.append(convert(value))
+                except (TypeError, ValueError):
+                    errors.append(f"Sheet {title}, row {number}: {name} has an invalid value {value!r}")
+                    values.append(None)
+            if len(errors) >= 20:
+                raise ValueError("\n".join(errors))
+            batch.append(values)
+
+            if len(batch) == batch_size:
+                conn.executemany(insert, batch)
+                count += len(batch)
+                batch = []
+                if progress:
+                    progress(table, count)
+        if batch:
+            conn.executemany(insert, batch)
+            count += len(batch)
+            if progress:
+                progress(table, count)
+
+    return columns, count
+
+
+def _merge_invoice_items(conn, columns, invoice_columns, expressions):
+    """Replace the items of the merged invoices with the staged ones, moved to the local invoice ids"""
+    if "id" not in invoice_columns:
+        raise ValueError("Merging invoice items needs the id column of the invoices sheet")
+    series = "COALESCE(s.series, '')" if "series" in invoice_columns else "''"
+    conn.execute(f'''
+        CREATE TEMP TABLE import_invoice_ids AS
+        SELECT s.id AS source_id, i.id AS local_id
+        FROM temp.import_invoices s
+        JOIN main.invoices i ON i.invoice_number = s.invoice_number AND i.series = {series}
+        WHERE s.id IS NOT NULL
+    ''')
+    try:
+        orphans = conn.execute('''
+            SELECT COUNT(*) FROM temp.import_invoice_items
+            WHERE invoice_id IS NULL OR invoice_id NOT IN (SELECT source_id FROM temp.import_invoice_ids)
+        ''').fetchone()[0]
+        if orphans:
+            raise ValueError(f"{orphans} invoice_items rows belong to no invoice of the invoices sheet")
+
+        conn.execute("DELETE FROM main.invoice_items WHERE invoice_id IN (SELECT local_id FROM temp.import_invoice_ids)")
+        merged = [name for name in columns if name != "id"]
+        select_list = ", ".join("m.local_id" if name == "invoice_id" else expressions[name] for name in merged)
+        conn.execute(
+            f"INSERT INTO main.invoice_items ({', '.join(merged)}) SELECT {select_list} "
+            "FROM temp.import_invoice_items s JOIN temp.import_invoice_ids m ON m.source_id = s.invoice_id"
+        )
+    finally:
+        conn.execute("DROP TABLE temp.import_invoice_ids")
+
+
+def import_excel(db, file_path, mode="replace", batch_size=5000, progress=None):
+    """Import the sheets of a workbook such as the one Export Data writes.
+
+    Sheets are matched to IMPORT_TABLES by name, "invoice_items (2)" being a
+    continuation of "invoice_items"; other sheets are skipped. Rows are
+    streamed from the workbook, checked against the table schema and loaded
+    into temporary staging tables with executemany. Only when every sheet is
+    valid are the tables replaced (mode "replace") or the rows merged on
+    their IMPORT_TABLES key (mode "merge"), all in one transaction.
+    progress is called as progress(table, rows_staged). Returns
+    {table: rows imported}.
+    """
+    if mode not in ("replace", "merge"):
+        raise ValueError(f"Unknown import mode {mode!r}")
+
+    with _open_workbook(file_path) as worksheets:
+        sheets = {}
+        for title, rows in worksheets:
+            table = re.sub(r" \(\d+\)$", "", title)
+            if table in IMPORT_TABLES:
+                sheets.setdefault(table, []).append((title, rows))
+        if not sheets:
+            raise ValueError(f"The workbook has no {', '.join(IMPORT_TABLES)} sheets")
+        if mode == "replace" and "invoices" in sheets and "invoice_items" not in sheets:
+            raise ValueError("Replacing invoices would delete their items; include the invoice_items sheet")
+        if mode == "merge" and "invoice_items" in sheets and "invoices" not in sheets:
+            raise ValueError("Merging invoice items needs the invoices sheet they belong to")
+
+        counts = {}
+        with db.write() as conn:
+            conn.execute("BEGIN")
+            try:
+                staged = {}
+                errors = []
+                for table in IMPORT_TABLES:
+                    if table in sheets:
+                        staged[table] = _stage_sheets(conn, table, sheets[table], mode, batch_size, progress, errors)
+                if errors:
+                    raise ValueError("\n".join(errors))
+
+                for table, (columns, count) in staged.items():
+                    column_list = ", ".join(columns)
+                    # Empty cells of NOT NULL columns take the column default
+                    defaults = {
+                        row[1]: row[4] for row in conn.execute(f"PRAGMA main.table_info({table})")
+                        if row[3] and row[4] is not None
+                    }
+                    expressions = {
+                        name: f"COALESCE({name}, {defaults[name]})" if name in defaults else name
+                        for name in columns
+                    }
+                    if mode == "replace":
+                        select_list = ", ".join(expressions[name] for name in columns)
+                        conn.execute(f"DELETE FROM main.{table}")
+                        conn.execute(f"INSERT INTO main.{table} ({column_list}) SELECT {select_list} FROM temp.import_{table}")
+                    elif table == "invoice_items":
+                        _merge_invoice_items(conn, columns, staged["invoices"][0], expressions)
+                    else:
+                        key = IMPORT_TABLES[table]
+                        merged = [name for name in columns if name != "id"]
+                        updates = ", ".join(f"{name} = excluded.{name}" for name in merged if name not in key)
+                        conn.execute(
+                            f"INSERT INTO main.{table} ({', '.join(merged)}) "
+                            f"SELECT {', '.join(expressions[name] for name in merged)} FROM temp.import_{table} WHERE true "
+                            f"ON CONFLICT({', '.join(key)}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+                        )
+                    counts[table] = count
+                if "invoices" in staged:
+                    sync_invoice_sequences(conn)
+                if "invoices" in staged or "invoice_items" in staged:
+                    index_invoice_items(conn)
+                    rebuild_sales_rollups(conn)
+            finally:
+                for table in sheets:
+                    conn.execute(f"DROP TABLE IF EXISTS temp.import_{table}")
+    return counts
+
+
+def load_invoice_record(conn, invoice_id):
+    """Read an invoice and its items from the database as a plain record"""
+    row = conn.execute('''
+        SELECT invoice_number, date, customer_name, customer_mobile,
+               customer_place, customer_address, bill_type, subtotal,
+               sgst, igst, roundoff, total, series
+        FROM invoices WHERE id = ?
+    ''', (invoice_id,)).fetchone()
+    if row is None:
+        return None
+        
+    items = conn.execute('''
+        SELECT sno, hsn, description, price, quantity, total
+        FROM invoice_items
+        WHERE invoice_id = ?
+        ORDER BY sno
+    ''', (invoice_id,)).fetchall()
+    
+    return {
+        "invoice_number": row[0],
+        "series": row[12],
+        "date": to_display_date(row[1]),
+        "bill_type": row[6] or "",
+        "customer": {
+            "name": row[2] or "",
+            "mobile": row[3] or "",
+            "place": row[4] or "",
+            "address": row[5] or ""
+        },
+        "items": items,
+        "subtotal": row[7] or 0.0,
+        "sgst": row[8] or 0.0,
+        "igst": row[9] or 0.0,
+        "roundoff": row[10] or 0.0,
+        "total": row[11] or 0.0
+    }
+
+
+def next_invoice_number(conn, series=""):
+    """Number the next invoice of a series will get, for display only"""
+    row = conn.execute("SELECT last_number FROM invoice_sequences WHERE series = ?", (series,)).fetchone()
+    return (row[0] if row else 0) + 1
+
+
+def reserve_invoice_number(conn, series=""):
+    """Take the next number of a series inside the caller's write transaction"""
+    conn.execute('''
+        INSERT INTO invoice_sequences (series, last_number) VALUES (?, 1)
+        ON CONFLICT(series) DO UPDATE SET last_number = last_number + 1
+    ''', (series,))
+    return conn.execute("SELECT last_number FROM invoice_sequences WHERE series = ?", (series,)).fetchone()[0]
+
+
+def claim_invoice_number(conn, series, number):
+    """Keep the sequence of a series past a number that was issued elsewhere"""
+    conn.execute('''
+        INSERT INTO invoice_sequences (series, last_number) VALUES (?, ?)
+        ON CONFLICT(series) DO UPDATE SET last_number = MAX(last_number, excluded.last_number)
+    ''', (series, number))
+
+
+def sync_invoice_sequences(conn):
+    """Move every sequence past the highest invoice number stored in its series"""
+    conn.execute('''
+        INSERT INTO invoice_sequences (series, last_number)
+        SELECT series, MAX(invoice_number) FROM invoices
+        WHERE invoice_number IS NOT NULL
+        GROUP BY series
+        ON CONFLICT(series) DO UPDATE SET last_number = MAX(last_number, excluded.last_number)
+    ''')
+
+
+class InvoiceRepository:
+    """Stores invoice records in the database, each batch in one transaction.
+
+    Numbers are reserved from invoice_sequences under BEGIN IMMEDIATE, and
+    the daily sales rollups are updated in the same transaction.
+    """
+
+    INSERT_INVOICE = '''
+        INSERT INTO invoices (
+            invoice_number, series, date, customer_name, customer_mobile,
+            customer_place, customer_address, bill_type, subtotal,
+            sgst, igst, roundoff, total, pdf_path
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    INSERT_ITEM = '''
+        INSERT INTO invoice_items (
+            invoice_id, sno, hsn, description, price, quantity, total
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    # Keep the details a customer gave last, but never blank out known ones
+    UPSERT_CUSTOMER = '''
+        INSERT INTO customers (name, mobile, place, address)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(mobile) DO UPDATE SET
+            name = COALESCE(NULLIF(excluded.name, ''), customers.name),
+            place = COALESCE(NULLIF(excluded.place, ''), customers.place),
+            address = COALESCE(NULLIF(excluded.address, ''), customers.address)
+    '''
+
+    ADD_SALES_DAILY = '''
+        INSERT INTO sales_daily (date, bill_type, invoices, subtotal, sgst, igst, total)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(date, bill_type) DO UPDATE SET
+            invoices = invoices + excluded.invoices,
+            subtotal = subtotal + excluded.subtotal,
+            sgst = sgst + excluded.sgst,
+            igst = igst + excluded.igst,
+            total = total + excluded.total
+    '''
+
+    ADD_SALES_HSN = '''
+        INSERT INTO sales_daily_hsn (date, hsn, quantity, total)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(date, hsn) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            total = total + excluded.total
+    '''
+
+    ADD_SALES_CUSTOMER = '''
+        INSERT INTO sales_daily_customer (date, customer, name, invoices, total)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(date, customer) DO UPDATE SET
+            name = excluded.name,
+            invoices = invoices + excluded.invoices,
+            total = total + excluded.total
+    '''
+
+    def __init__(self, db):
+        self.db = db
+
+    def save(self, record, file_path, reserve=False):
+        """Store one invoice record and return its id"""
+        return self.save_many([(record, file_path)], reserve)[0]
+
+    def save_many(self, invoices, reserve=False):
+        """Store (record, file_path) pairs in one transaction and return their ids.
+
+        With reserve, each invoice gets the next number of its series, which
+        is written into its record. Otherwise the records keep their numbers,
+        as invoices synced from another counter do, and the sequences move
+        past them. Either every invoice is stored or, on any error, none is.
+        """
+        invoices = list(invoices)
+        numbers = [record["invoice_number"] for record, file_path in invoices]
+        try:
+            with self.db.write() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                return self._insert(conn, invoices, reserve)
+        except BaseException:
+            # The reserved numbers were rolled back with the invoices
+            for (record, file_path), number in zip(invoices, numbers):
+                record["invoice_number"] = number
+            raise
+
+    def set_pdf_path(self, invoice_id, file_path):
+        """Record where the PDF of a stored invoice was written"""
+        with self.db.write() as conn:
+            conn.execute("UPDATE invoices SET pdf_path = ? WHERE id = ?", (file_path, invoice_id))
+
+    @staticmethod
+    def _add(totals, key, *values):
+        current = totals.get(key)
+        totals[key] = values if current is None else tuple(a + b for a, b in zip(current, values))
+
+    def _insert(self, conn, invoices, reserve):
+        invoice_ids = []
+        items = []
+        customers = {}
+        # Rollup rows of the batch, summed here so each key is upserted once
+        daily = {}
+        daily_hsn = {}
+        daily_customer = {}
+        customer_names = {}
+        for record, file_path in invoices:
+            series = record.get("series", "")
+            if reserve:
+                record["invoice_number"] = reserve_invoice_number(conn, series)
+            else:
+                claim_invoice_number(conn, series, record["invoice_number"])
+            customer = record["customer"]
+            date = to_iso_date(record["date"])
+            invoice_id = conn.execute(self.INSERT_INVOICE, (
+                record["invoice_number"],
+                series,
+                date,
+                customer["name"],
+                customer["mobile"],
+                customer["place"],
+                customer["address"],
+                record["bill_type"],
+                record["subtotal"],
+                record["sgst"],
+                record["igst"],
+                record["roundoff"],
+                record["total"],
+                file_path
+            )).lastrowid
+            invoice_ids.append(invoice_id)
+            items.extend((invoice_id, *row) for row in record["items"])
+
+            self._add(
+                daily, (date, record["bill_type"] or ""),
+                1, record["subtotal"], record["sgst"], record["igst"], record["total"]
+            )
+            for sno, hsn, description, price, quantity, total in record["items"]:
+                self._add(daily_hsn, (date, hsn or ""), quantity, total)
+            customer_key = (date, customer["mobile"] or customer["name"] or "")
+            self._add(daily_customer, customer_key, 1, record["total"])
+            customer_names[customer_key] = customer["name"]
+
+            if customer["mobile"]:
+                customers[customer["mobile"]] = (
+                    customer["name"],
+                    customer["mobile"],
+                    customer["place"],
+                    customer["address"]
+                )
+
+        conn.executemany(self.INSERT_ITEM, items)
+        index_invoice_items(conn, invoice_ids)
+        conn.executemany(self.UPSERT_CUSTOMER, customers.values())
+        conn.executemany(self.ADD_SALES_DAILY, (key + values for key, values in daily.items()))
+        conn.executemany(self.ADD_SALES_HSN, (key + values for key, values in daily_hsn.items()))
+        conn.executemany(self.ADD_SALES_CUSTOMER, (
+            (*key, customer_names[key], *values) for key, values in daily_customer.items()
+        ))
+        return invoice_ids
+
+
+def select_invoice_ids(conn, first_number=None, last_number=None, from_date=None, to_date=None):
+    """Ids of the invoices in an invoice number range and/or a dd-mm-YYYY date range"""
+    query = "SELECT id FROM invoices WHERE 1 = 1"
+    params = []
+    if first_number is not None:
+        query += " AND invoice_number >= ?"
+        params.append(first_number)
+    if last_number is not None:
+        query += " AND invoice_number <= ?"
+        params.append(last_number)
+    if from_date:
+        query += " AND date >= ?"
+        params.append(to_iso_date(from_date))
+    if to_date:
+        query += " AND date <= ?"
+        params.append(to_iso_date(to_date))
+    return [row[0] for row in conn.execute(query + " ORDER BY invoice_number", params)]
+
+
+# Per-process state of the batch render workers
+_render_conn = None
+_render_config = None
+
+
+def _init_render_worker(db_file, config):
+    global _render_conn, _render_config
+    _render_conn = connect_database(db_file, read_only=True)
+    _render_config = config
+
+
+def _render_invoice_job(invoice_id, output_dir):
+    record = load_invoice_record(_render_conn, invoice_id)
+    if record is None:
+        raise LookupError(f"Invoice {invoice_id} not found")
+    file_path = os.path.join(output_dir, invoice_pdf_filename(record))
+    render_invoice_pdf(record, _render_config, file_path)
+    return file_path
+
+
+def render_invoices(db_file, config, output_dir, invoice_ids, max_workers=None, progress=None):
+    """Render many stored invoices to PDF across a pool of worker processes.
+
+    Returns a list of (invoice_id, file_path, error) tuples. ``progress`` is
+    called as progress(done, total) after each invoice finishes.
+    """
+    results = []
+    if not invoice_ids:
+        return results
+        
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_render_worker,
+        initargs=(db_file, config)
+    ) as executor:
+        futures = {
+            executor.submit(_render_invoice_job, invoice_id, output_dir): invoice_id
+            for invoice_id in invoice_ids
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            invoice_id = futures[future]
+            try:
+                results.append((invoice_id, future.result(), None))
+            except Exception as e:
+                results.append((invoice_id, None, str(e)))
+            if progress:
+                progress(done, len(futures))
+    return results
+
+
+class InvoiceJob:
+    """A saved invoice waiting to be rendered and stored"""
+    __slots__ = ("record", "config", "file_path", "on_done", "on_error")
+
+    def __init__(self, record, config, file_path, on_done=None, on_error=None):
+        self.record = record
+        self.config = config
+        self.file_path = file_path
+        self.on_done = on_done
+        self.on_error = on_error
+
+
+class InvoiceJobQueue:
+    """Background pipeline that renders and stores saved invoices.
+
+    Each job carries its own copy of the invoice record, so the UI can start
+    the next invoice straight away. Worker threads render in parallel, store
+    through the InvoiceRepository, and report back through an event queue that
+    the Tk main loop drains with master.after; callbacks therefore always run
+    on the UI thread.
+    """
+
+    def __init__(self, master, repository, workers=2, poll_interval=100, on_progress=None):
+        self.master = master
+        self.repository = repository
+        self.poll_interval = poll_interval
+        self.on_progress = on_progress
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.pending = 0
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"invoice-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.master.after(self.poll_interval, self._poll)
+
+    def submit(self, record, config, file_path, on_done=None, on_error=None):
+        """Queue an invoice for rendering to file_path and saving to the database"""
+        record = copy.deepcopy(record)
+        record["items"] = tuple(tuple(item) for item in record["items"])
+        self.pending += 1
+        self.jobs.put(InvoiceJob(record, copy.deepcopy(config), file_path, on_done, on_error))
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            try:
+                # The number is only final once the invoice is stored
+                shown_name = invoice_pdf_filename(job.record)
+                self.events.put((job, "progress", "Saving to database"))
+                invoice_id = self.repository.save(job.record, job.file_path, reserve=True)
+            except Exception as e:
+                self.events.put((job, "error", e))
+                continue
+            try:
+                # Another counter took the number shown; keep a default name in step
+                if os.path.basename(job.file_path) == shown_name != invoice_pdf_filename(job.record):
+                    job.file_path = os.path.join(os.path.dirname(job.file_path), invoice_pdf_filename(job.record))
+                    self.repository.set_pdf_path(invoice_id, job.file_path)
+                self.events.put((job, "progress", "Rendering PDF"))
+                render_invoice_pdf(job.record, job.config, job.file_path)
+                self.events.put((job, "done", None))
+            except Exception as e:
+                self.events.put((job, "error", RuntimeError(
+                    f"The invoice was stored, but its PDF could not be written: {e}. "
+                    "Use Re-render Invoices to create it."
+                )))
+
+    def _dispatch(self, job, kind, payload):
+        if kind == "progress":
+            if self.on_progress:
+                self.on_progress(job, payload)
+            return
+        self.pending -= 1
+        if kind == "done" and job.on_done:
+            job.on_done(job)
+        elif kind == "error" and job.on_error:
+            job.on_error(job, payload)
+
+    def _poll(self):
+        try:
+            while True:
+                self._dispatch(*self.events.get_nowait())
+        except queue.Empty:
+            pass
+        self.master.after(self.poll_interval, self._poll)
+
+    def shutdown(self):
+        """Finish the queued jobs and stop the workers"""
+        for thread in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        # Deliver the last results while the UI still exists
+        try:
+            while True:
+                self._dispatch(*self.events.get_nowait())
+        except queue.Empty:
+            pass
+
+
+class ProductSearchIndex:
+    """In-memory index for product autocomplete by HSN code or name.
+
+    Keep it in step with the product list through add and remove.
+    """
+
+    FIELDS = ("hsn", "name")
+
+    def __init__(self, products=()):
+        self.rebuild(products)
+
+    @staticmethod
+    def _trigrams(value):
+        return {value[i:i + 3] for i in range(len(value) - 2)}
+
+    @staticmethod
+    def _words(value):
+        return set(re.findall(r"\w+", value))
+
+    def rebuild(self, products):
+        """Index a whole product list at once"""
+        # Entries refer to products by a number, which always compares
+        self._ids = {}
+        self._next_id = 0
+        self._products = {}
+        self._keys = {field: {} for field in self.FIELDS}
+        self._values = {field: [] for field in self.FIELDS}
+        self._grams = {field: {} for field in self.FIELDS}
+        self._words_index = []
+        self._vocabulary = {}
+        self._vocabulary_grams = {}
+        for product in products:
+            self._index(product, sort=False)
+        for values in self._values.values():
+            values.sort()
+        self._words_index.sort()
+
+    def _index(self, product, sort):
+        product_id = self._next_id
+        self._next_id += 1
+        self._ids[product["hsn"]] = product_id
+        self._products[product_id] = product
+        for field in self.FIELDS:
+            value = str(product[field] or "").lower()
+            self._keys[field][product_id] = value
+            self._insert(self._values[field], [(value, product_id)], sort)
+            if field == "name":
+                words = self._words(value)
+                self._insert(self._words_index, [(word, product_id) for word in words], sort)
+                for word in words:
+                    if word not in self._vocabulary:
+                        self._vocabulary[word] = 0
+                        for gram in self._trigrams(word):
+                            self._vocabulary_grams.setdefault(gram, set()).add(word)
+                    self._vocabulary[word] += 1
+            grams = self._grams[field]
+            for gram in self._trigrams(value):
+                grams.setdefault(gram, set()).add(product_id)
+
+    @staticmethod
+    def _insert(array, entries, sort):
+        for entry in entries:
+            if sort:
+                bisect.insort(array, entry)
+            else:
+                array.append(entry)
+
+    @staticmethod
+    def _delete(array, entry):
+        i = bisect.bisect_left(array, entry)
+        if i < len(array) and array[i] == entry:
+            del array[i]
+
+    def add(self, product):
+        """Index a new product, or a product whose HSN code or name changed"""
+        self.remove(product["hsn"])
+        self._index(product, sort=True)
+
+    def remove(self, hsn):
+        """Drop a product from the index"""
+        product_id = self._ids.pop(hsn, None)
+        if product_id is None:
+            return
+        del self._products[product_id]
+        for field in self.FIELDS:
+            value = self._keys[field].pop(product_id)
+            self._delete(self._values[field], (value, product_id))
+            if field == "name":
+                for word in self._words(value):
+                    self._delete(self._words_index, (word, product_id))
+                    self._vocabulary[word] -= 1
+                    if not self._vocabulary[word]:
+                        del self._vocabulary[word]
+                        self._discard_grams(self._vocabulary_grams, word, word)
+            self._discard_grams(self._grams[field], value, product_id)
+
+    def _discard_grams(self, grams, value, member):
+        for gram in self._trigrams(value):
+            grams[gram].discard(member)
+            if not grams[gram]:
+                del grams[gram]
+
+    @staticmethod
+    def _prefixed(array, term):
+        # Entries are (value, product id), so (term,) sorts before every match
+        for i in range(bisect.bisect_left(array, (term,)), len(array)):
+            value, product_id = array[i]
+            if not value.startswith(term):
+                break
+            yield product_id
+
+    def _candidates(self, grams, term):
+        sets = sorted((grams.get(gram, set()) for gram in self._trigrams(term)), key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def _containing_word(self, term):
+        words = [word for word in self._candidates(self._vocabulary_grams, term) if term in word]
+        words.sort(key=lambda word: (word.find(term), len(word), word))
+        for word in words:
+            start = bisect.bisect_left(self._words_index, (word,))
+            end = bisect.bisect_left(self._words_index, (word, self._next_id))
+            for i in range(start, end):
+                yield self._words_index[i][1]
+
+    def _containing(self, field, term, count, seen):
+        candidates = self._candidates(self._grams[field], term)
+        candidates.difference_update(seen)
+        keys = self._keys[field]
+        # Earlier and shorter matches first
+        matches = [(keys[product_id].find(term), len(keys[product_id]), product_id) for product_id in candidates]
+        return [product_id for position, length, product_id in heapq.nsmallest(
+            count, (match for match in matches if match[0] >= 0)
+        )]
+
+    def search(self, field, term, limit=50):
+        """Best matches for term in a field ("hsn" or "name"), as product dicts"""
+        term = term.strip().lower()
+        results = []
+        seen = set()
+
+        def take(product_ids):
+            for product_id in product_ids:
+                if product_id not in seen:
+                    seen.add(product_id)
+                    results.append(self._products[product_id])
+                    if len(results) == limit:
+                        return True
+            return False
+
+        if take(self._prefixed(self._values[field], term)):
+            return results
+        if field == "name" and take(self._prefixed(self._words_index, term)):
+            return results
+        # Shorter terms are too common for substring matches to help
+        if len(term) < 3:
+            return results
+        if field == "name" and re.fullmatch(r"\w+", term):
+            take(self._containing_word(term))
+        else:
+            take(self._containing(field, term, limit - len(results), seen))
+        return results
+
+
+class DebouncedSearch:
+    """Runs a search once typing pauses and applies only the latest result.
+
+    search(term, cancelled) runs on the executor when one is given;
+    apply(result) always runs on the UI thread.
+    """
+
+    def __init__(self, master, search, apply, delay=250, executor=None, on_error=None, poll_interval=30):
+        self.master = master
+        self.search = search
+        self.apply = apply
+        self.delay = delay
+        self.executor = executor
+        self.on_error = on_error
+        self.poll_interval = poll_interval
+        self._timer = None
+        self._generation = 0
+        self._future = None
+        self._results = queue.Queue()
+        self._polling = False
+
+    def trigger(self, term):
+        """Search for term once no other trigger follows within the delay"""
+        if self._timer is not None:
+            self.master.after_cancel(self._timer)
+        self._timer = self.master.after(self.delay, self._start, term)
+
+    def cancel(self):
+        """Drop the pending and running searches"""
+        if self._timer is not None:
+            self.master.after_cancel(self._timer)
+            self._timer = None
+        self._generation += 1
+        if self._future is not None:
+            self._future.cancel()
+
+    def _start(self, term):
+        self._timer = None
+        self._generation += 1
+        generation = self._generation
+
+        def cancelled():
+            return generation != self._generation
+
+        if self.executor is None:
+            self._finish(generation, *self._run(term, cancelled))
+            return
+        # A search that has not started yet is simply dropped
+        if self._future is not None:
+            self._future.cancel()
+        self._future = self.executor.submit(
+            lambda: self._results.put((generation, *self._run(term, cancelled)))
+        )
+        if not self._polling:
+            self._polling = True
+            self.master.after(self.poll_interval, self._poll)
+
+    def _run(self, term, cancelled):
+        try:
+            return self.search(term, cancelled), None
+        except Exception as e:
+            return None, e
+
+    def _poll(self):
+        try:
+            while True:
+                self._finish(*self._results.get_nowait())
+        except queue.Empty:
+            pass
+        # The result is queued before the future completes
+        if not self._future.done() or not self._results.empty():
+            self.master.after(self.poll_interval, self._poll)
+        else:
+            self._polling = False
+
+    def _finish(self, generation, result, error):
+        if generation != self._generation:
+            return
+        if error is None:
+            self.apply(result)
+        elif self.on_error:
+            self.on_error(error)
+
+
+class PagedTreeview:
+    """Shows a source in a ttk.Treeview a page at a time, keeping at most max_pages loaded.
+
+    A source is fetch(after, limit) returning (rows, key): the rows after the
+    previous page's key and this page's key, None after the last page.
+    """
+
+    def __init__(self, tree, scrollbar, page_size=200, format_row=tuple, max_pages=5):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.page_size = page_size
+        self.format_row = format_row
+        self.max_pages = max_pages
+        self.version = None
+        self._fetch = None
+        # (after, item ids, key) of the loaded pages, top to bottom
+        self._pages = []
+        # after of each page dropped above the loaded ones, nearest last
+        self._above = []
+        self._loading = False
+        tree.configure(yscrollcommand=self._on_scroll)
+
+    def show(self, fetch, first_page=None, version=None):
+        """Replace the rows with those of a source, from its first page"""
+        self._fetch = fetch
+        self.version = version
+        self.tree.delete(*self.tree.get_children())
+        self._pages = []
+        self._above = []
+        self.tree.yview_moveto(0)
+        self._add_page(None, first_page or fetch(None, self.page_size), at_end=True)
+
+    def reload(self, version=None):
+        """Show the current source again from the start"""
+        if self._fetch is not None:
+            self.show(self._fetch, version=version)
+
+    def _add_page(self, after, page, at_end):
+        rows, key = page
+        if at_end:
+            items = [self.tree.insert("", "end", values=self.format_row(row)) for row in rows]
+            self._pages.append((after, items, key))
+        else:
+            items = [
+                self.tree.insert("", position, values=self.format_row(row))
+                for position, row in enumerate(rows)
+            ]
+            self._pages.insert(0, (after, items, key))
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._loading or not self._pages:
+            return
+        # Not while Tk is still laying out the rows just added
+        if float(last) > 0.9 and self._pages[-1][2] is not None:
+            self._loading = True
+            self.tree.after_idle(self._load_below)
+        elif float(first) < 0.1 and self._above:
+            self._loading = True
+            self.tree.after_idle(self._load_above)
+
+    def _first_visible(self):
+        return round(float(self.tree.yview()[0]) * len(self.tree.get_children()))
+
+    def _scroll_to(self, row):
+        self.tree.yview_moveto(row / max(len(self.tree.get_children()), 1))
+
+    def _load_below(self):
+        self._loading = False
+        if not self._pages or self._pages[-1][2] is None:
+            return
+        self._add_page(self._pages[-1][2], self._fetch(self._pages[-1][2], self.page_size), at_end=True)
+        if len(self._pages) > self.max_pages:
+            row = self._first_visible()
+            after, items, key = self._pages.pop(0)
+            self.tree.delete(*items)
+            self._above.append(after)
+            self._scroll_to(row - len(items))
+
+    def _load_above(self):
+        self._loading = False
+        if not self._above:
+            return
+        row = self._first_visible()
+        after = self._above.pop()
+        self._add_page(after, self._fetch(after, self.page_size), at_end=False)
+        if len(self._pages) > self.max_pages:
+            self.tree.delete(*self._pages.pop()[1])
+        self._scroll_to(row + len(self._pages[0][1]))
+
+
+# Longest span of days charted by day, then by week; longer spans by month
+CHART_DAILY_DAYS = 62
+CHART_WEEKLY_DAYS = 366
+
+
+def sales_buckets(dates, amounts):
+    """Sum daily sales into day, week or month buckets sized for their span.
+
+    dates are ascending ISO dates with the sales amount of each. Returns
+    (unit, edges, totals): the bucket size, the len(totals) + 1 bucket
+    boundaries as datetime64[D], weeks starting on Monday, and the sum of
+    each bucket, zero for buckets without sales, as Axes.stairs takes them.
+    """
+    days = np.array(dates, dtype="datetime64[D]")
+    amounts = np.asarray(amounts, dtype=float)
+    span = int((days[-1] - days[0]).astype(np.int64)) + 1
+    day_numbers = days.astype(np.int64)
+
+    if span <= CHART_DAILY_DAYS:
+        unit = "day"
+        buckets = day_numbers
+        to_edges = lambda numbers: numbers.astype("datetime64[D]")
+    elif span <= CHART_WEEKLY_DAYS:
+        # Day 0, 1 January 1970, was a Thursday
+        unit = "week"
+        buckets = (day_numbers + 3) // 7
+        to_edges = lambda numbers: (numbers * 7 - 3).astype("datetime64[D]")
+    else:
+        unit = "month"
+        buckets = days.astype("datetime64[M]").astype(np.int64)
+        to_edges = lambda numbers: numbers.astype("datetime64[M]").astype("datetime64[D]")
+
+    first = buckets[0]
+    count = int(buckets[-1] - first) + 1
+    totals = np.bincount(buckets - first, weights=amounts, minlength=count)
+    edges = to_edges(np.arange(first, first + count + 1))
+    return unit, edges, totals
+
+
+def sales_report(conn, from_date, to_date):
+    """Sales between two dd-mm-YYYY dates as (report text, chart buckets).
+
+    The chart buckets are those of sales_buckets, or None without sales;
+    the daily rollups answer any range without reading invoice lines.
+    """
+    date_range = (to_iso_date(from_date), to_iso_date(to_date))
+    rows = conn.execute('''
+        SELECT date, SUM(invoices), SUM(subtotal), SUM(sgst + igst), SUM(total)
+        FROM sales_daily
+        WHERE date BETWEEN ? AND ?
+        GROUP BY date
+        ORDER BY date
+    ''', date_range).fetchall()
+    if not rows:
+        return "No sales data found for the selected period", None
+    bill_types = conn.execute('''
+        SELECT bill_type, SUM(invoices), SUM(total)
+        FROM sales_daily
+        WHERE date BETWEEN ? AND ?
+        GROUP BY bill_type
+        ORDER BY SUM(total) DESC
+    ''', date_range).fetchall()
+    top_customers = conn.execute('''
+        SELECT MAX(name), SUM(invoices), SUM(total)
+        FROM sales_daily_customer
+        WHERE date BETWEEN ? AND ?
+        GROUP BY customer
+        ORDER BY SUM(total) DESC
+        LIMIT 10
+    ''', date_range).fetchall()
+    sales_data = [(to_display_date(row[0]), *row[1:]) for row in rows]
+
+    lines = [
+        f"Sales Report from {from_date} to {to_date}",
+        "=" * 50,
+        "",
+        f"{'Date':<12}{'Invoices':>10}{'Subtotal':>15}{'Tax':>12}{'Amount':>15}",
+        "-" * 64,
+    ]
+    lines.extend(
+        f"{date:<12}{invoices:>10}{subtotal:>15.2f}{tax:>12.2f}{total:>15.2f}"
+        for date, invoices, subtotal, tax, total in sales_data
+    )
+
+    lines += ["", f"{'Bill Type':<22}{'Invoices':>10}{'Amount':>15}", "-" * 47]
+    lines.extend(
+        f"{(bill_type or '-')[:20]:<22}{invoices:>10}{total:>15.2f}"
+        for bill_type, invoices, total in bill_types
+    )
+
+    lines += ["", f"{'Top Customers':<32}{'Invoices':>10}{'Amount':>15}", "-" * 57]
+    lines.extend(
+        f"{(name or '-')[:30]:<32}{invoices:>10}{total:>15.2f}"
+        for name, invoices, total in top_customers
+    )
+
+    lines += [
+        "",
+        "=" * 50,
+        f"Total Invoices: {sum(row[1] for row in sales_data)}",
+        f"Total Sales: {sum(row[4] for row in sales_data):.2f}",
+    ]
+    chart = sales_buckets([row[0] for row in rows], [row[4] for row in rows])
+    return "\n".join(lines) + "\n", chart
+
+
+def product_report(conn):
+    """Quantity and sales of every product, best selling first, as report text"""
+    # Get product sales data from the daily HSN rollup
+    product_data = conn.execute('''
+        SELECT p.hsn, p.name, s.quantity as total_quantity,
+               s.total as total_sales
+        FROM (
+            SELECT hsn, SUM(quantity) AS quantity, SUM(total) AS total
+            FROM sales_daily_hsn
+            GROUP BY hsn
+        ) s
+        JOIN products p ON p.hsn = s.hsn
+        ORDER BY total_sales DESC
+    ''').fetchall()
+    if not product_data:
+        return "No product sales data found"
+
+    lines = [
+        "Product Sales Report",
+        "=" * 50,
+        "",
+        f"{'HSN':<10}{'Product Name':<30}{'Qty Sold':>10}{'Total Sales':>15}",
+        "-" * 65,
+    ]
+    lines.extend(
+        f"{hsn:<10}{(name or '')[:28]:<30}{quantity:>10g}{total:>15.2f}"
+        for hsn, name, quantity, total in product_data
+    )
+    lines += [
+        "",
+        "=" * 50,
+        f"Total Quantity Sold: {sum(row[2] for row in product_data):g}",
+        f"Total Sales: {sum(row[3] for row in product_data):.2f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class ReportCache:
+    """Computes reports off the UI thread and keeps them until the database changes.
+
+    A report is requested for a slot, the place it is shown, with a key
+    naming the report and its parameters. compute(conn) runs on the executor
+    with a pooled read connection, unless the cache already holds a result
+    for the key computed at the current Database.data_version. show(result)
+    then runs on the UI thread, and only when the slot is not already
+    showing that very result, so switching back to a report whose data has
+    not changed costs neither a query nor a redraw. A slot shows only the
+    result of its latest request.
+    """
+
+    def __init__(self, master, db, executor, poll_interval=50):
+        self.master = master
+        self.db = db
+        self.executor = executor
+        self.poll_interval = poll_interval
+        self._results = {}
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._shown = {}
+        self._finished = queue.Queue()
+        self._futures = set()
+
+    def request(self, slot, key, compute, show, on_error=None):
+        """Show the report for key in slot, computing it only if the data changed"""
+        request = object()
+        self._requests[slot] = request
+        future = self.executor.submit(self._get, key, compute)
+        future.add_done_callback(lambda f: self._finished.put((slot, request, key, show, on_error, f)))
+        if not self._futures:
+            self.master.after(self.poll_interval, self._poll)
+        self._futures.add(future)
+
+    def _get(self, key, compute):
+        version = self.db.data_version()
+        with self._lock:
+            cached = self._results.get(key)
+        if cached is not None and cached[0] == version:
+            return version, cached[1]
+
+        with self.db.read(background=True) as conn:
+            result = compute(conn)
+        with self._lock:
+            # Results of older versions can never be used again
+            self._results = {
+                other: entry for other, entry in self._results.items() if entry[0] == version
+            }
+            self._results[key] = (version, result)
+        return version, result
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    finished = self._finished.get_nowait()
+                except queue.Empty:
+                    break
+                slot, request, key, show, on_error, future = finished
+                self._futures.discard(future)
+                try:
+                    self._finish(*finished)
+                except Exception as e:
+                    # One failing report must not keep the others from showing
+                    self._shown.pop(slot, None)
+                    self._report_error(on_error, e)
+        finally:
+            if self._futures:
+                self.master.after(self.poll_interval, self._poll)
+
+    def _finish(self, slot, request, key, show, on_error, future):
+        if future.cancelled() or self._requests.get(slot) is not request:
+            return
+        error = future.exception()
+        if error is not None:
+            self._shown.pop(slot, None)
+            self._report_error(on_error, error)
+            return
+        version, result = future.result()
+        if self._shown.get(slot) != (key, version):
+            show(result)
+            self._shown[slot] = (key, version)
+
+    def _report_error(self, on_error, error):
+        try:
+            if on_error is None:
+                raise error
+            on_error(error)
+        except Exception:
+            self.master.report_callback_exception(*sys.exc_info())
+
 
 class BillingSystem:
     invoice_count = 0
@@ -70,10 +2902,43 @@ class BillingSystem:
         self.load_config()
         
         # Initialize variables
-        self.invoice_number = self.get_last_invoice_number() + 1
         self.date = datetime.now().strftime("%d-%m-%Y")
+        self.invoice_number = self.get_next_invoice_number()
+        # Database id of the invoice loaded into the editor, if any
+        self.loaded_invoice_id = None
         self.products = []  # For product history
+        self.product_index = ProductSearchIndex()
         self.current_theme = "Default"
+
+        # Searches run when typing pauses; database lookups on a worker thread
+        self.search_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search")
+        self.product_autocomplete = {
+            field: DebouncedSearch(
+                self.master,
+                lambda term, cancelled, field=field: self.product_index.search(field, term),
+                lambda results, field=field: self.show_product_choices(field, results),
+                delay=100
+            )
+            for field in ProductSearchIndex.FIELDS
+        }
+        self.products_table_search = DebouncedSearch(
+            self.master,
+            self.query_products_table,
+            lambda result: self.show_records(self.products_view, "products", *result),
+            executor=self.search_executor,
+            on_error=lambda e: messagebox.showerror("Error", f"Search failed: {str(e)}")
+        )
+        self.customers_table_search = DebouncedSearch(
+            self.master,
+            self.query_customers_table,
+            lambda result: self.show_records(self.customers_view, "customers", *result),
+            executor=self.search_executor,
+            on_error=lambda e: messagebox.showerror("Error", f"Search failed: {str(e)}")
+        )
+
+        # Reports are computed on their own thread and recomputed only after writes
+        self.report_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+        self.report_cache = ReportCache(self.master, self.db, self.report_executor)
         
         # Setup UI
         self.setup_ui()
@@ -89,76 +2954,52 @@ class BillingSystem:
         # Setup idle timer for auto-save
         self.setup_auto_save()
 
-    def init_database(self):
-        """Initialize SQLite database"""
-        self.conn = sqlite3.connect(self.DB_FILE)
-        self.cursor = self.conn.cursor()
-        
-        # Create tables if they don't exist
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                invoice_number INTEGER,
-                date TEXT,
-                customer_name TEXT,
-                customer_mobile TEXT,
-                customer_place TEXT,
-                customer_address TEXT,
-                bill_type TEXT,
-                subtotal REAL,
-                sgst REAL,
-                igst REAL,
-                roundoff REAL,
-                total REAL,
-                pdf_path TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        # Render and store saved invoices in the background
+        self.job_queue = InvoiceJobQueue(
+            self.master,
+            self.invoices,
+            on_progress=lambda job, message: self.status_label.config(
+                text=f"Invoice {self.job_title(job)}: {message}..."
             )
-        ''')
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoice_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                invoice_id INTEGER,
-                sno INTEGER,
-                hsn TEXT,
-                description TEXT,
-                price REAL,
-                quantity INTEGER,
-                total REAL,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
-            )
-        ''')
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                hsn TEXT UNIQUE,
-                name TEXT,
-                price REAL,
-                category TEXT,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                mobile TEXT UNIQUE,
-                place TEXT,
-                address TEXT,
-                gstin TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        self.conn.commit()
+        )
+
+        # Back up the database while the application is running
+        self.backup_service = BackupService(self.db)
+        self.setup_auto_backup()
+        self.poll_backups()
+
+    def init_database(self):
+        """Open the SQLite database and upgrade its schema"""
+        try:
+            self.db = Database(self.DB_FILE)
+        except sqlite3.IntegrityError as e:
+            messagebox.showerror("Database Error", f"The database could not be upgraded.\n\n{e}")
+            raise SystemExit(1)
+        self.invoices = InvoiceRepository(self.db)
+
+    def invoice_series(self):
+        """Series the invoice being edited is numbered in"""
+        if self.config["number_per_financial_year"]:
+            return financial_year(self.date)
+        return ""
+
+    def get_next_invoice_number(self):
+        """Number the next saved invoice will most likely get.
+
+        The number is only reserved when the invoice is saved, so another
+        counter on the same database may take it first.
+        """
+        with self.db.read() as conn:
+            return next_invoice_number(conn, self.invoice_series())
+
+    def show_next_invoice_number(self):
+        """Show the number the next invoice will get"""
+        self.invoice_number = self.get_next_invoice_number()
+        self.invoice_label.config(text=f"Invoice No: {format_invoice_number(self.invoice_number, self.invoice_series())}")
 
-    def get_last_invoice_number(self):
-        """Get the last invoice number from database"""
-        self.cursor.execute("SELECT MAX(invoice_number) FROM invoices")
-        result = self.cursor.fetchone()
-        return result[0] if result[0] is not None else 0
+    def job_title(self, job):
+        """Invoice number of a job; final once the invoice is stored"""
+        return format_invoice_number(job.record["invoice_number"], job.record["series"])
 
     def load_config(self):
         """Load configuration from file or use defaults"""
@@ -186,6 +3027,13 @@ class BillingSystem:
             },
             "auto_save": True,
             "auto_save_interval": 5,  # minutes
+            "auto_backup": True,
+            "backup_location": os.path.join(os.path.expanduser("~"), "BillingSystemBackups"),
+            "backup_interval": 24,  # hours
+            "backup_generations": 7,
+            "last_export_at": None,
+            "last_export_ids": None,
+            "number_per_financial_year": False,
             "default_theme": "Default"
         }
         
@@ -208,6 +3056,7 @@ class BillingSystem:
 
     def save_config(self):
         """Save configuration to file"""
+        invalidate_letterhead()
         try:
             with open(self.CONFIG_FILE, 'w') as f:
                 json.dump(self.config, f, indent=4)
@@ -287,6 +3136,7 @@ class BillingSystem:
         file_menu.add_command(label="Save Invoice", command=self.save_bill, accelerator="Ctrl+S")
         file_menu.add_command(label="Print Invoice", command=self.print_bill, accelerator="Ctrl+P")
         file_menu.add_command(label="Export to Excel", command=self.export_to_excel)
+        file_menu.add_command(label="Re-render Invoices...", command=self.rerender_invoices_dialog)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.on_exit)
         menubar.add_cascade(label="File", menu=file_menu)
@@ -406,6 +3256,8 @@ class BillingSystem:
         self.sales_ax = self.sales_figure.add_subplot(111)
         self.sales_canvas = FigureCanvasTkAgg(self.sales_figure, chart_frame)
         self.sales_canvas.get_tk_widget().pack(fill="both", expand=True)
+        # Created by the first generate_sales_chart, then updated in place
+        self.sales_steps = None
         
         # Product report
         product_frame = ttk.Frame(reports_notebook)
@@ -425,6 +3277,46 @@ class BillingSystem:
         )
         self.product_report_text.pack(fill="both", expand=True, padx=5, pady=5)
 
+        # Analytics
+        analytics_frame = ttk.Frame(reports_notebook)
+        reports_notebook.add(analytics_frame, text="Analytics")
+
+        analytics_controls = ttk.Frame(analytics_frame)
+        analytics_controls.pack(fill="x", padx=5, pady=5)
+
+        ttk.Label(analytics_controls, text="Analysis:").pack(side="left", padx=5)
+        self.analytics_var = tk.StringVar(value=next(iter(analytics.REPORTS)))
+        analytics_choice = ttk.Combobox(
+            analytics_controls,
+            textvariable=self.analytics_var,
+            values=list(analytics.REPORTS),
+            state="readonly",
+            width=28
+        )
+        analytics_choice.pack(side="left", padx=5)
+        analytics_choice.bind("<<ComboboxSelected>>", lambda e: self.generate_analytics_report())
+
+        ttk.Label(
+            analytics_controls,
+            text="Over the Sales Report dates, or all sales when they are empty"
+        ).pack(side="left", padx=5)
+
+        ttk.Button(
+            analytics_controls,
+            text="Generate",
+            command=self.generate_analytics_report
+        ).pack(side="right", padx=5)
+
+        # Columns are set by the analysis shown
+        self.analytics_tree = ttk.Treeview(analytics_frame, show="headings")
+        y_scroll = ttk.Scrollbar(analytics_frame, orient="vertical", command=self.analytics_tree.yview)
+        x_scroll = ttk.Scrollbar(analytics_frame, orient="horizontal", command=self.analytics_tree.xview)
+        self.analytics_tree.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+
+        self.analytics_tree.pack(side="left", fill="both", expand=True)
+        y_scroll.pack(side="right", fill="y")
+        x_scroll.pack(side="bottom", fill="x")
+
     def setup_products_tab(self):
         """Setup the products tab"""
         # Top frame for controls
@@ -490,7 +3382,8 @@ class BillingSystem:
         # Add scrollbars
         y_scroll = ttk.Scrollbar(self.products_tab, orient="vertical", command=self.products_table.yview)
         x_scroll = ttk.Scrollbar(self.products_tab, orient="horizontal", command=self.products_table.xview)
-        self.products_table.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+        self.products_table.configure(xscrollcommand=x_scroll.set)
+        self.products_view = PagedTreeview(self.products_table, y_scroll)
         
         # Grid layout
         self.products_table.pack(side="left", fill="both", expand=True)
@@ -567,7 +3460,8 @@ class BillingSystem:
         # Add scrollbars
         y_scroll = ttk.Scrollbar(self.customers_tab, orient="vertical", command=self.customers_table.yview)
         x_scroll = ttk.Scrollbar(self.customers_tab, orient="horizontal", command=self.customers_table.xview)
-        self.customers_table.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+        self.customers_table.configure(xscrollcommand=x_scroll.set)
+        self.customers_view = PagedTreeview(self.customers_table, y_scroll)
         
         # Grid layout
         self.customers_table.pack(side="left", fill="both", expand=True)
@@ -690,7 +3584,7 @@ class BillingSystem:
         
         self.invoice_label = ttk.Label(
             self.invoice_frame, 
-            text=f"Invoice No: {self.invoice_number:04d}",
+            text=f"Invoice No: {format_invoice_number(self.invoice_number, self.invoice_series())}",
             style="InvoiceInfo.TLabel"
         )
         self.invoice_label.pack(side="left")
@@ -924,6 +3818,12 @@ class BillingSystem:
         # Bind events
         self.product_table.bind("<Delete>", lambda e: self.clear_selected())
         self.product_table.bind("<Double-1>", self.edit_selected_item)
+        # +/- on the table change the quantity of the selected lines
+        for key, amount in (("<plus>", 1), ("<KP_Add>", 1), ("<minus>", -1), ("<KP_Subtract>", -1)):
+            self.product_table.bind(key, lambda e, amount=amount: self.change_selected_quantity(amount))
+        
+        # Line items live in the model; the table only mirrors it
+        self.invoice_model = InvoiceModel(self.product_table)
 
     def setup_totals(self):
         """Setup the totals section"""
@@ -1255,7 +4155,7 @@ class BillingSystem:
 
     def auto_save(self):
         """Auto-save the current invoice"""
-        if self.product_table.get_children():
+        if self.invoice_model:
             try:
                 # Save to a temporary file
                 temp_dir = os.path.join(os.path.expanduser("~"), "temp_bills")
@@ -1273,6 +4173,34 @@ class BillingSystem:
         # Reset timer
         self.setup_auto_save()
 
+    def setup_auto_backup(self):
+        """Schedule automatic database backups from the config"""
+        if self.config["auto_backup"] and self.config["backup_location"]:
+            self.backup_service.schedule(
+                self.config["backup_location"],
+                self.config["backup_interval"],
+                self.config["backup_generations"]
+            )
+        else:
+            self.backup_service.cancel()
+
+    def poll_backups(self):
+        """Report finished background backups"""
+        try:
+            while True:
+                path, error = self.backup_service.results.get_nowait()
+                if error is None:
+                    message = f"Backup created: {path}"
+                else:
+                    message = f"Backup failed: {str(error)}"
+                    print(message)
+                self.status_label.config(text=message)
+                if hasattr(self, 'db_status_label') and self.db_status_label.winfo_exists():
+                    self.db_status_label.config(text=message)
+        except queue.Empty:
+            pass
+        self.master.after(1000, self.poll_backups)
+
     def toggle_auto_save(self):
         """Toggle auto-save on/off"""
         self.config["auto_save"] = not self.config["auto_save"]
@@ -1300,16 +4228,8 @@ class BillingSystem:
             product_name = self.product_name_entry.get()
             price = float(self.price_entry.get())
             quantity = int(self.quantity_entry.get())
-            subtotal = price * quantity
 
-            self.product_table.insert("", "end", values=(
-                len(self.product_table.get_children()) + 1, 
-                product_id, 
-                product_name, 
-                f"{price:.2f}", 
-                quantity, 
-                f"{subtotal:.2f}"
-            ))
+            self.invoice_model.add(product_id, product_name, price, quantity)
 
             # Add to product history if not already there
             self.add_to_product_history(product_id, product_name, price)
@@ -1327,27 +4247,17 @@ class BillingSystem:
 
     def calculate_totals(self):
         """Calculate invoice totals"""
-        subtotal = 0.0
-        for child in self.product_table.get_children():
-            subtotal += float(self.product_table.item(child, "values")[5])
-
-        sgst_rate = self.config["tax_rates"]["sgst"] / 100
-        igst_rate = self.config["tax_rates"]["igst"] / 100
-        
-        sgst = subtotal * sgst_rate
-        igst = subtotal * igst_rate
-        grand_total = subtotal + sgst + igst
-        roundoff = round(grand_total) - grand_total
-        final_total = grand_total + roundoff
+        accumulator = self.invoice_model.totals
+        accumulator.set_rates(self.config["tax_rates"]["sgst"], self.config["tax_rates"]["igst"])
+        totals = accumulator.totals()
 
-        self.subtotal_var.set(f"{subtotal:.2f}")
-        self.sgst_var.set(f"{sgst:.2f}")
-        self.igst_var.set(f"{igst:.2f}")
-        self.roundoff_var.set(f"{roundoff:.2f}")
-        self.total_cost_var.set(f"{final_total:.2f}")
+        self.subtotal_var.set(f"{paise_to_rupees(totals.subtotal):.2f}")
+        self.sgst_var.set(f"{paise_to_rupees(totals.sgst):.2f}")
+        self.igst_var.set(f"{paise_to_rupees(totals.igst):.2f}")
+        self.roundoff_var.set(f"{paise_to_rupees(totals.roundoff):.2f}")
+        self.total_cost_var.set(f"{paise_to_rupees(totals.total):.2f}")
 
-        grand_total_in_words = num2words(final_total).title() + " Rupees Only"
-        self.grand_total_words_var.set(grand_total_in_words)
+        self.grand_total_words_var.set(amount_in_words(totals.total))
 
     def clear_selected(self):
         """Clear selected items from the table"""
@@ -1356,33 +4266,50 @@ class BillingSystem:
             messagebox.showwarning("Warning", "No items selected")
             return
             
-        for selected_item in selected_items:
-            self.product_table.delete(selected_item)
-        self.reorder_sno()
+        discount = self.invoice_model.totals.discount_paise
+        self.invoice_model.remove(selected_items)
         self.calculate_totals()
+        self.report_dropped_discount(discount)
+
+    def report_dropped_discount(self, discount):
+        """Tell the cashier when an edit removed the discount, given its amount before the edit"""
+        if discount and not self.invoice_model.totals.discount_paise and self.invoice_model:
+            messagebox.showwarning(
+                "Discount Removed",
+                f"The discount of {paise_to_rupees(discount):.2f} is more than the items now add up to "
+                "and was removed. Apply a new discount if one is still due."
+            )
 
     def clear_all(self):
         """Clear all items from the table"""
         if not messagebox.askyesno("Confirm", "Are you sure you want to clear all items?"):
             return
             
-        for child in self.product_table.get_children():
-            self.product_table.delete(child)
+        self.invoice_model.clear()
+        self.loaded_invoice_id = None
         self.calculate_totals()
 
-    def reorder_sno(self):
-        """Reorder serial numbers in the table"""
-        for i, child in enumerate(self.product_table.get_children(), 1):
-            values = self.product_table.item(child, 'values')
-            self.product_table.item(child, values=(i, *values[1:]))
-
-    def save_bill(self):
-        """Save the bill as PDF"""
-        if not self.product_table.get_children():
+    def save_bill(self, open_when_done=False):
+        """Save the bill as PDF and store it in the background"""
+        if not self.invoice_model:
             messagebox.showwarning("Warning", "No products added to the invoice")
             return
-            
-        default_filename = f"Invoice_{self.invoice_number:04d}_{self.date.replace('-', '')}.pdf"
+
+        if self.loaded_invoice_id is not None:
+            # Saving stores a second invoice; the stored one stays as it is
+            if not messagebox.askyesno(
+                "Save as Copy",
+                "This invoice was loaded from the database and is already saved.\n\n"
+                "Save these items as a new invoice with the next number? "
+                "To print the saved invoice again, use Re-render Invoices instead."
+            ):
+                return
+            self.loaded_invoice_id = None
+            self.show_next_invoice_number()
+
+        default_filename = invoice_pdf_filename(
+            {"invoice_number": self.invoice_number, "series": self.invoice_series(), "date": self.date}
+        )
         file_path = filedialog.asksaveasfilename(
             defaultextension=".pdf",
             filetypes=[("PDF files", "*.pdf")],
@@ -1390,187 +4317,179 @@ class BillingSystem:
         )
         
         if file_path:
-            self.generate_pdf(file_path)
-            self.save_invoice_to_db(file_path)
+            self.job_queue.submit(
+                self.snapshot_invoice(),
+                self.config,
+                file_path,
+                on_done=lambda job: self.on_invoice_saved(job, open_when_done),
+                on_error=self.on_invoice_save_failed
+            )
+
+            # The job has its own copy, so the next invoice can start right away;
+            # its number is final when it is stored
             self.invoice_number += 1
-            self.invoice_label.config(text=f"Invoice No: {self.invoice_number:04d}")
-            self.clear_all()
+            self.invoice_label.config(text=f"Invoice No: {format_invoice_number(self.invoice_number, self.invoice_series())}")
+            self.invoice_model.clear()
+            self.loaded_invoice_id = None
+            self.calculate_totals()
             return file_path
         return None
 
-    def print_bill(self):
-        """Print the bill"""
-        file_path = self.save_bill()
-        if file_path:
-            self.open_pdf(file_path)
-
-    def generate_pdf(self, file_path):
-        """Generate PDF invoice"""
-        c = canvas.Canvas(file_path, pagesize=A4)
-        width, height = A4
-
-        primary_color = colors.HexColor(self.config["primary_color"])
-        secondary_color = colors.HexColor(self.config["secondary_color"])
-        accent_color = colors.HexColor(self.config["accent_color"])
+    def on_invoice_saved(self, job, open_pdf=False):
+        """Called on the UI thread once a background save has finished"""
+        self.status_label.config(text=f"Invoice {self.job_title(job)} saved to {job.file_path}")
+        if not self.invoice_model and not self.job_queue.pending:
+            self.show_next_invoice_number()
+        if open_pdf:
+            self.open_pdf(job.file_path)
 
-        try:
-            # Get the path of the logo
-            if getattr(sys, 'frozen', False):  # Check if the application is bundled by PyInstaller
-                logo_path = os.path.join(sys._MEIPASS, "logo.png")
-            else:
-                logo_path = os.path.join(os.path.dirname(__file__), "logo.png")
-                
-            if os.path.exists(logo_path):
-                c.drawImage(logo_path, 40, height - 80, width=50, height=50)
-        except Exception as e:
-            print(f"Error loading logo for PDF: {e}")
+    def on_invoice_save_failed(self, job, error):
+        """Called on the UI thread when a background save fails"""
+        if not self.invoice_model and not self.job_queue.pending:
+            self.show_next_invoice_number()
+        self.status_label.config(text=f"Invoice {self.job_title(job)} was not saved")
+        # The editor was cleared when the job was queued; the job still has the invoice
+        if not messagebox.askyesno(
+            "Database Error",
+            f"Failed to save invoice {self.job_title(job)}: {str(error)}\n\n"
+            "Load it back into the editor to save it again?",
+            icon="error"
+        ):
+            return
+        if self.invoice_model and not messagebox.askyesno(
+            "Confirm", "This replaces the invoice being edited. Continue?"
+        ):
+            return
+        self.load_record(job.record)
 
-        # Header
-        c.setFont("Helvetica-Bold", 16)
-        c.setFillColor(primary_color)
-        c.drawCentredString(width / 2.0, height - 50, self.config["company_name"])
-        
-        c.setFont("Helvetica", 12)
-        c.setFillColor(colors.black)
-        c.drawCentredString(width / 2.0, height - 70, self.config["company_address"])
-        c.drawCentredString(width / 2.0, height - 90, f"Phone: {self.config['company_phone']} | Email: {self.config.get('company_email', '')}")
-        
-        c.drawString(30, height - 110, f"GSTIN: {self.config['gstin']}")
-        c.drawRightString(width - 30, height - 110, f"Date: {self.date}")
-        c.drawRightString(width - 30, height - 130, f"Invoice No: {self.invoice_number:04d}")
-        c.drawRightString(width - 30, height - 150, f"Bill Type: {self.bill_type_var.get()}")
+    def print_bill(self):
+        """Print the bill once it has been saved"""
+        self.save_bill(open_when_done=True)
 
-        # Customer info
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(30, height - 180, "Customer Name: ")
-        c.drawString(30, height - 200, "Mobile Number: ")
-        c.drawString(30, height - 220, "Place: ")
-        c.drawString(30, height - 240, "Address: ")
+    def generate_pdf(self, file_path, record=None):
+        """Generate PDF invoice"""
+        render_invoice_pdf(record or self.snapshot_invoice(), self.config, file_path)
 
-        c.setFont("Helvetica", 12)
-        c.drawString(150, height - 180, self.name_entry.get())
-        c.drawString(150, height - 200, self.mobile_entry.get())
-        c.drawString(150, height - 220, self.place_entry.get())
-        c.drawString(150, height - 240, self.address_entry.get())
+    def snapshot_invoice(self):
+        """Plain-data record of the invoice being edited"""
+        totals = self.invoice_model.totals.totals()
+        return {
+            "invoice_number": self.invoice_number,
+            "series": self.invoice_series(),
+            "date": self.date,
+            "bill_type": self.bill_type_var.get(),
+            "customer": {
+                "name": self.name_entry.get(),
+                "mobile": self.mobile_entry.get(),
+                "place": self.place_entry.get(),
+                "address": self.address_entry.get()
+            },
+            "items": self.invoice_model.rows(),
+            "subtotal": float(paise_to_rupees(totals.subtotal)),
+            "sgst": float(paise_to_rupees(totals.sgst)),
+            "igst": float(paise_to_rupees(totals.igst)),
+            "roundoff": float(paise_to_rupees(totals.roundoff)),
+            "total": float(paise_to_rupees(totals.total))
+        }
 
-        # Products table
-        c.setFont("Helvetica-Bold", 12)
-        y_position = height - 280
-        
-        # Table header
-        table_header = [
-            ["S.No", "HSN", "Product Description", "Price", "Quantity", "Total"]
-        ]
-        
-        # Table data
-        table_data = []
-        for i, child in enumerate(self.product_table.get_children(), 1):
-            values = self.product_table.item(child, "values")
-            table_data.append([str(i)] + list(values[1:]))
-        
-        # Combine header and data
-        table_data = table_header + table_data
-        
-        # Create table
-        table = Table(table_data, colWidths=[40, 80, 250, 60, 60, 60])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), primary_color),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('GRID', (0, 0), (-1, -1), 1, colors.lightgrey),
-            ('ALIGN', (2, 1), (2, -1), 'LEFT'),  # Product description left-aligned
-            ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),  # Numbers right-aligned
-        ]))
-        
-        # Draw table
-        table.wrapOn(c, width, height)
-        table.drawOn(c, 30, y_position - len(table_data) * 20)
-        
-        # Totals
-        y_position -= (len(table_data) * 50 + 60)
-        
-        # Create totals table
-        totals_data = [
-            ["Subtotal:", self.subtotal_var.get()],
-            # [f"SGST ({self.config['tax_rates']['sgst']}%):", self.sgst_var.get()],
-            # [f"IGST ({self.config['tax_rates']['igst']}%):", self.igst_var.get()],
-            ["Roundoff:", self.roundoff_var.get()],
-            ["Grand Total:", self.total_cost_var.get()]
-        ]
+    def rerender_invoices_dialog(self):
+        """Re-render stored invoices to PDF for an invoice number or date range"""
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Re-render Invoices")
+        dialog.transient(self.master)
+        dialog.grab_set()
         
-        totals_table = Table(totals_data, colWidths=[150, 100])
-        totals_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('TEXTCOLOR', (0, -1), (-1, -1), accent_color),
-            ('FONTSIZE', (0, -1), (-1, -1), 14),
-            ('LINEABOVE', (0, 0), (-1, 0), 1, colors.lightgrey),
-            ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-        ]))
+        ttk.Label(dialog, text="From Invoice No:").grid(row=0, column=0, padx=5, pady=5, sticky="e")
+        first_entry = ttk.Entry(dialog)
+        first_entry.grid(row=0, column=1, padx=5, pady=5)
         
-        totals_table.wrapOn(c, width, height)
-        totals_table.drawOn(c, width - 300, y_position)
+        ttk.Label(dialog, text="To Invoice No:").grid(row=1, column=0, padx=5, pady=5, sticky="e")
+        last_entry = ttk.Entry(dialog)
+        last_entry.grid(row=1, column=1, padx=5, pady=5)
         
-        # Amount in words
-        styles = getSampleStyleSheet()
-        styleN = styles['Normal']
-        styleN.wordWrap = 'CJK'
+        ttk.Label(dialog, text="From Date (dd-mm-yyyy):").grid(row=2, column=0, padx=5, pady=5, sticky="e")
+        from_entry = ttk.Entry(dialog)
+        from_entry.grid(row=2, column=1, padx=5, pady=5)
         
-        words = Paragraph(f"<b>Amount in words:</b> {self.grand_total_words_var.get()}", styleN)
-        words.wrapOn(c, 500, 300)
-        words.drawOn(c, 30, y_position - 40)
+        ttk.Label(dialog, text="To Date (dd-mm-yyyy):").grid(row=3, column=0, padx=5, pady=5, sticky="e")
+        to_entry = ttk.Entry(dialog)
+        to_entry.grid(row=3, column=1, padx=5, pady=5)
         
-        # Bank details
-        bank_details = [
-            f"Bank: {self.config['bank_details']['name']}",
-            f"A/C No: {self.config['bank_details']['account']}",
-            f"IFSC: {self.config['bank_details']['ifsc']}",
-            f"Branch: {self.config['bank_details']['branch']}"
-        ]
+        def start():
+            try:
+                with self.db.read() as conn:
+                    invoice_ids = select_invoice_ids(
+                        conn,
+                        int(first_entry.get()) if first_entry.get() else None,
+                        int(last_entry.get()) if last_entry.get() else None,
+                        from_entry.get() or None,
+                        to_entry.get() or None
+                    )
+            except ValueError:
+                messagebox.showerror("Error", "Please enter valid invoice numbers and dates", parent=dialog)
+                return
+                
+            if not invoice_ids:
+                messagebox.showinfo("Re-render Invoices", "No invoices found in the selected range", parent=dialog)
+                return
+                
+            output_dir = filedialog.askdirectory(parent=dialog, title="Select output folder")
+            if not output_dir:
+                return
+                
+            dialog.destroy()
+            self.start_batch_render(invoice_ids, output_dir)
         
-        y_position -= 100
-        for i, detail in enumerate(bank_details):
-            c.drawString(30, y_position - (i * 20), detail)
-        
-        # Footer
-        c.drawRightString(width - 30, y_position - 50, f"For {self.config['company_name']}")
-        c.drawRightString(width - 60, y_position - 70, "Seal and Signature")
-        
-        # QR Code
-        qr_data = f"""
-        Company: {self.config['company_name']}
-        Invoice No: {self.invoice_number:04d}
-        Date: {self.date}
-        Customer: {self.name_entry.get()}
-        Total: {self.total_cost_var.get()}
-        """
+        ttk.Button(
+            dialog,
+            text="Render",
+            command=start,
+            style="Accent.TButton"
+        ).grid(row=4, column=0, columnspan=2, pady=10)
+
+    def start_batch_render(self, invoice_ids, output_dir):
+        """Render invoices in worker processes without blocking the UI"""
+        progress_queue = queue.Queue()
         
-        try:
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=4,
-                border=4,
-            )
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-            qr_img_path = os.path.join(os.path.dirname(file_path), f"qr_{self.invoice_number}.png")
-            qr_img.save(qr_img_path)
-            
-            # Draw QR code on PDF
-            c.drawImage(qr_img_path, 30, y_position - 150, width=80, height=80)
-            os.remove(qr_img_path)
-        except Exception as e:
-            print(f"Error generating QR code: {e}")
+        def run():
+            try:
+                results = render_invoices(
+                    self.db.db_file,
+                    dict(self.config),
+                    output_dir,
+                    invoice_ids,
+                    progress=lambda done, total: progress_queue.put(("progress", done, total))
+                )
+                progress_queue.put(("done", results, None))
+            except Exception as e:
+                progress_queue.put(("error", str(e), None))
         
-        c.showPage()
-        c.save()
+        def poll():
+            try:
+                while True:
+                    kind, first, second = progress_queue.get_nowait()
+                    if kind == "progress":
+                        self.status_label.config(text=f"Rendering invoices: {first}/{second}")
+                    elif kind == "error":
+                        self.status_label.config(text="Invoice rendering failed")
+                        messagebox.showerror("Re-render Invoices", f"Failed to render invoices: {first}")
+                        return
+                    else:
+                        failed = [r for r in first if r[2]]
+                        self.status_label.config(text=f"Rendered {len(first) - len(failed)} invoices to {output_dir}")
+                        if failed:
+                            messagebox.showwarning(
+                                "Re-render Invoices",
+                                f"{len(failed)} invoices failed, e.g. invoice id {failed[0][0]}: {failed[0][2]}"
+                            )
+                        return
+            except queue.Empty:
+                pass
+            self.master.after(200, poll)
+        
+        self.status_label.config(text=f"Rendering {len(invoice_ids)} invoices...")
+        threading.Thread(target=run, daemon=True).start()
+        self.master.after(200, poll)
 
     def open_pdf(self, file_path):
         """Open PDF file with default viewer"""
@@ -1581,16 +4500,15 @@ class BillingSystem:
 
     def new_invoice(self):
         """Create a new invoice"""
-        if self.product_table.get_children() and not messagebox.askyesno(
+        if self.invoice_model and not messagebox.askyesno(
             "New Invoice", 
             "Current invoice has items. Create new invoice anyway?"
         ):
             return
             
         self.clear_all()
-        self.invoice_number += 1
         self.date = datetime.now().strftime("%d-%m-%Y")
-        self.invoice_label.config(text=f"Invoice No: {self.invoice_number:04d}")
+        self.show_next_invoice_number()
         self.date_label.config(text=f"Date: {self.date}")
         self.name_entry.focus()
 
@@ -1601,7 +4519,7 @@ class BillingSystem:
             return
             
         selected_item = selected_items[0]
-        values = self.product_table.item(selected_item, "values")
+        values = self.invoice_model.get(selected_item).values()
         
         # Create edit dialog
         edit_dialog = tk.Toplevel(self.master)
@@ -1636,17 +4554,17 @@ class BillingSystem:
         # Save button
         def save_changes():
             try:
-                new_values = (
-                    values[0],  # Keep same S.No
+                discount = self.invoice_model.totals.discount_paise
+                self.invoice_model.update(
+                    selected_item,
                     product_id_entry.get(),
                     product_name_entry.get(),
-                    f"{float(price_entry.get()):.2f}",
-                    int(quantity_entry.get()),
-                    f"{float(price_entry.get()) * int(quantity_entry.get()):.2f}"
+                    float(price_entry.get()),
+                    int(quantity_entry.get())
                 )
-                self.product_table.item(selected_item, values=new_values)
                 self.calculate_totals()
                 edit_dialog.destroy()
+                self.report_dropped_discount(discount)
             except ValueError:
                 messagebox.showerror("Error", "Please enter valid numbers for price and quantity")
         
@@ -1668,6 +4586,19 @@ class BillingSystem:
             self.quantity_entry.delete(0, tk.END)
             self.quantity_entry.insert(0, str(amount))
 
+    def change_selected_quantity(self, amount):
+        """Change the quantity of the selected lines by amount, keeping at least one"""
+        changed = False
+        discount = self.invoice_model.totals.discount_paise
+        for selected_item in self.product_table.selection():
+            line = self.invoice_model.get(selected_item)
+            if line is not None and line.quantity + amount >= 1:
+                self.invoice_model.add_quantity(selected_item, amount)
+                changed = True
+        if changed:
+            self.calculate_totals()
+            self.report_dropped_discount(discount)
+
     def apply_discount(self):
         """Apply discount to the invoice"""
         discount = simpledialog.askfloat(
@@ -1678,13 +4609,12 @@ class BillingSystem:
         )
         
         if discount is not None:
-            subtotal = float(self.subtotal_var.get())
-            new_subtotal = subtotal - discount
-            if new_subtotal < 0:
-                messagebox.showerror("Error", "Discount cannot be greater than subtotal")
+            try:
+                self.invoice_model.totals.set_discount(to_paise(discount))
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
                 return
                 
-            self.subtotal_var.set(f"{new_subtotal:.2f}")
             self.calculate_totals()
 
     def appearance_settings(self):
@@ -1868,14 +4798,25 @@ class BillingSystem:
         igst_entry = ttk.Spinbox(settings_dialog, from_=0, to=100, increment=0.1)
         igst_entry.grid(row=1, column=1, padx=5, pady=5)
         igst_entry.set(self.config["tax_rates"]["igst"])
+
+        # Invoice numbering
+        per_year_var = tk.BooleanVar(value=self.config["number_per_financial_year"])
+        ttk.Checkbutton(
+            settings_dialog,
+            text="Restart invoice numbers every financial year (April to March)",
+            variable=per_year_var
+        ).grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="w")
         
         def save_settings():
             self.config["tax_rates"].update({
                 "sgst": float(sgst_entry.get()),
                 "igst": float(igst_entry.get())
             })
+            self.config["number_per_financial_year"] = per_year_var.get()
             self.save_config()
             self.calculate_totals()
+            if not self.invoice_model:
+                self.show_next_invoice_number()
             settings_dialog.destroy()
             messagebox.showinfo("Success", "Tax settings saved successfully.")
         
@@ -1884,7 +4825,7 @@ class BillingSystem:
             text="Save", 
             command=save_settings,
             style="Accent.TButton"
-        ).grid(row=2, column=0, columnspan=2, pady=10)
+        ).grid(row=3, column=0, columnspan=2, pady=10)
 
     def database_settings(self):
         """Open database settings dialog"""
@@ -1910,12 +4851,22 @@ class BillingSystem:
         ).grid(row=0, column=1, padx=5, pady=5)
         
         # Export data button
+        export_new_only_var = tk.BooleanVar(value=False)
         ttk.Button(
             settings_dialog,
-            text="Export Data to Excel",
-            command=self.export_database_to_excel,
+            text="Export Data...",
+            command=lambda: self.export_database_to_excel(export_new_only_var.get()),
             style="Accent.TButton"
         ).grid(row=1, column=0, padx=5, pady=5)
+
+        last_export = self.config["last_export_at"] if self.config["last_export_ids"] else None
+        ttk.Checkbutton(
+            settings_dialog,
+            text=f"Only data added since the last export ({last_export} UTC)" if last_export
+                else "Only data added since the last export",
+            variable=export_new_only_var,
+            state="normal" if last_export else "disabled"
+        ).grid(row=1, column=2, padx=5, pady=5, sticky="w")
         
         # Import data button
         ttk.Button(
@@ -1925,9 +4876,70 @@ class BillingSystem:
             style="Secondary.TButton"
         ).grid(row=1, column=1, padx=5, pady=5)
         
+        # Rebuild report totals button
+        ttk.Button(
+            settings_dialog,
+            text="Rebuild Report Totals",
+            command=self.rebuild_report_totals,
+            style="Secondary.TButton"
+        ).grid(row=0, column=2, padx=5, pady=5, sticky="w")
+
+        # Automatic backups
+        auto_backup_var = tk.BooleanVar(value=self.config["auto_backup"])
+        ttk.Checkbutton(
+            settings_dialog,
+            text="Enable Automatic Backups",
+            variable=auto_backup_var
+        ).grid(row=2, column=0, columnspan=2, pady=5, sticky="w")
+
+        ttk.Label(settings_dialog, text="Backup Folder:").grid(row=3, column=0, padx=5, pady=5, sticky="e")
+        backup_location_entry = ttk.Entry(settings_dialog, width=40)
+        backup_location_entry.grid(row=3, column=1, padx=5, pady=5)
+        backup_location_entry.insert(0, self.config["backup_location"])
+
+        def browse_backup_location():
+            folder = filedialog.askdirectory(initialdir=backup_location_entry.get() or None)
+            if folder:
+                backup_location_entry.delete(0, tk.END)
+                backup_location_entry.insert(0, folder)
+
+        ttk.Button(
+            settings_dialog,
+            text="Browse...",
+            command=browse_backup_location
+        ).grid(row=3, column=2, padx=5, pady=5)
+
+        ttk.Label(settings_dialog, text="Backup Every (hours):").grid(row=4, column=0, padx=5, pady=5, sticky="e")
+        backup_interval = ttk.Spinbox(settings_dialog, from_=1, to=168)
+        backup_interval.grid(row=4, column=1, padx=5, pady=5)
+        backup_interval.set(self.config["backup_interval"])
+
+        ttk.Label(settings_dialog, text="Backups to Keep:").grid(row=5, column=0, padx=5, pady=5, sticky="e")
+        backup_generations = ttk.Spinbox(settings_dialog, from_=1, to=100)
+        backup_generations.grid(row=5, column=1, padx=5, pady=5)
+        backup_generations.set(self.config["backup_generations"])
+
+        def save_backup_settings():
+            self.config.update({
+                "auto_backup": auto_backup_var.get(),
+                "backup_location": backup_location_entry.get(),
+                "backup_interval": int(backup_interval.get()),
+                "backup_generations": int(backup_generations.get())
+            })
+            self.save_config()
+            self.setup_auto_backup()
+            self.db_status_label.config(text="Backup settings saved")
+
+        ttk.Button(
+            settings_dialog,
+            text="Save Backup Settings",
+            command=save_backup_settings,
+            style="Accent.TButton"
+        ).grid(row=6, column=0, columnspan=2, pady=5)
+
         # Status label
         self.db_status_label = ttk.Label(settings_dialog, text="")
-        self.db_status_label.grid(row=2, column=0, columnspan=2, pady=5)
+        self.db_status_label.grid(row=7, column=0, columnspan=2, pady=5)
 
     def backup_database(self):
         """Backup the database to a file"""
@@ -1938,24 +4950,9 @@ class BillingSystem:
         )
         
         if backup_file:
-            try:
-                # Close current connection
-                self.conn.close()
-                
-                # Copy file
-                import shutil
-                shutil.copy2(self.DB_FILE, backup_file)
-                
-                # Reopen connection
-                self.conn = sqlite3.connect(self.DB_FILE)
-                self.cursor = self.conn.cursor()
-                
-                self.db_status_label.config(text=f"Backup created: {backup_file}")
-            except Exception as e:
-                self.db_status_label.config(text=f"Backup failed: {str(e)}")
-                # Try to reopen connection even if backup failed
-                self.conn = sqlite3.connect(self.DB_FILE)
-                self.cursor = self.conn.cursor()
+            # Online backup; poll_backups reports the result
+            self.db_status_label.config(text="Backing up...")
+            self.backup_service.run_async(backup_file)
 
     def restore_database(self):
         """Restore the database from a backup"""
@@ -1967,82 +4964,194 @@ class BillingSystem:
         )
         
         if backup_file:
-            try:
-                # Close current connection
-                self.conn.close()
-                
-                # Copy backup file
-                import shutil
-                shutil.copy2(backup_file, self.DB_FILE)
-                
-                # Reopen connection
-                self.conn = sqlite3.connect(self.DB_FILE)
-                self.cursor = self.conn.cursor()
-                
+            self.db_status_label.config(text="Restoring...")
+            results = queue.Queue()
+
+            def run():
+                try:
+                    self.db.restore(backup_file)
+                    results.put(None)
+                except Exception as e:
+                    results.put(e)
+
+            def poll():
+                try:
+                    error = results.get_nowait()
+                except queue.Empty:
+                    self.master.after(200, poll)
+                    return
+
+                if error is not None:
+                    self.db_status_label.config(text=f"Restore failed: {str(error)}")
+                    messagebox.showerror("Error", f"Restore failed: {str(error)}")
+                    return
+
+                self.reload_database_views()
                 self.db_status_label.config(text=f"Database restored from: {backup_file}")
-                messagebox.showinfo("Success", "Database restored successfully. Please restart the application.")
+                messagebox.showinfo("Success", "Database restored successfully.")
+
+            threading.Thread(target=run, daemon=True).start()
+            poll()
+
+    def rebuild_report_totals(self):
+        """Recompute the daily sales rollups from all invoices in the background"""
+        self.db_status_label.config(text="Rebuilding report totals...")
+        results = queue.Queue()
+
+        def run():
+            try:
+                with self.db.write() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    rebuild_sales_rollups(conn)
+                results.put(None)
             except Exception as e:
-                self.db_status_label.config(text=f"Restore failed: {str(e)}")
-                # Try to reopen connection even if restore failed
-                self.conn = sqlite3.connect(self.DB_FILE)
-                self.cursor = self.conn.cursor()
+                results.put(e)
+
+        def poll():
+            try:
+                error = results.get_nowait()
+            except queue.Empty:
+                self.master.after(200, poll)
+                return
+
+            if error is not None:
+                self.db_status_label.config(text=f"Rebuild failed: {str(error)}")
+                messagebox.showerror("Error", f"Rebuilding report totals failed: {str(error)}")
+                return
+
+            self.db_status_label.config(text="Report totals rebuilt")
+
+        threading.Thread(target=run, daemon=True).start()
+        poll()
 
-    def export_database_to_excel(self):
-        """Export database tables to Excel"""
+    def reload_database_views(self):
+        """Show data that was restored or imported without restarting"""
+        if not self.invoice_model:
+            self.show_next_invoice_number()
+
+        self.load_product_history()
+        self.load_products_table()
+        self.load_customers_table()
+
+    def export_database_to_excel(self, new_only=False):
+        """Export database tables to Excel, CSV or Parquet in the background"""
         export_file = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
-            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
+            filetypes=[
+                ("Excel files", "*.xlsx"),
+                ("CSV files (one per table)", "*.csv"),
+                ("Parquet files (one per table)", "*.parquet")
+            ],
             initialfile="billing_data_export.xlsx"
         )
-        
+
         if export_file:
-            try:
-                # Get all table names
-                self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                tables = [table[0] for table in self.cursor.fetchall()]
-                
-                # Create Excel writer
-                with pd.ExcelWriter(export_file) as writer:
-                    for table in tables:
-                        # Read table data
-                        df = pd.read_sql_query(f"SELECT * FROM {table}", self.conn)
-                        # Write to Excel sheet
-                        df.to_excel(writer, sheet_name=table, index=False)
-                
-                self.db_status_label.config(text=f"Data exported to: {export_file}")
-                messagebox.showinfo("Success", "Database exported to Excel successfully.")
-            except Exception as e:
-                self.db_status_label.config(text=f"Export failed: {str(e)}")
+            since = self.config["last_export_ids"] if new_only else None
+            events = queue.Queue()
+
+            def run():
+                try:
+                    watermark = export_database(
+                        self.db,
+                        export_file,
+                        since=since,
+                        progress=lambda table, done, total: events.put(("progress", (table, done, total)))
+                    )
+                    events.put(("done", watermark))
+                except Exception as e:
+                    events.put(("error", e))
+
+            def set_status(text):
+                self.status_label.config(text=text)
+                if self.db_status_label.winfo_exists():
+                    self.db_status_label.config(text=text)
+
+            def poll():
+                try:
+                    while True:
+                        kind, payload = events.get_nowait()
+                        if kind == "progress":
+                            table, done, total = payload
+                            set_status(f"Exporting {table}... {done * 100 // max(total, 1)}%")
+                        elif kind == "done":
+                            self.config["last_export_at"], self.config["last_export_ids"] = payload
+                            self.save_config()
+                            set_status(f"Data exported to: {export_file}")
+                            messagebox.showinfo("Success", "Database exported successfully.")
+                            return
+                        else:
+                            set_status(f"Export failed: {str(payload)}")
+                            return
+                except queue.Empty:
+                    pass
+                self.master.after(200, poll)
+
+            set_status("Exporting...")
+            threading.Thread(target=run, daemon=True).start()
+            poll()
 
     def import_database_from_excel(self):
         """Import data from Excel to database"""
-        if not messagebox.askyesno("Confirm", "This will overwrite existing data in the database. Continue?"):
+        mode = messagebox.askyesnocancel(
+            "Import Data",
+            "Merge the workbook into the existing data?\n\n"
+            "Yes: update matching products (by HSN), customers (by mobile) and invoices (by number), and add new ones.\n"
+            "No: replace the imported tables with the workbook."
+        )
+        if mode is None:
             return
-            
+        mode = "merge" if mode else "replace"
+        if mode == "replace" and not messagebox.askyesno("Confirm", "This will overwrite existing data in the database. Continue?"):
+            return
+
         import_file = filedialog.askopenfilename(
             filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")]
         )
-        
+
         if import_file:
-            try:
-                # Read Excel file
-                excel_data = pd.ExcelFile(import_file)
-                
-                # Process each sheet (table)
-                for sheet_name in excel_data.sheet_names:
-                    df = excel_data.parse(sheet_name)
-                    
-                    # Delete existing data
-                    self.cursor.execute(f"DELETE FROM {sheet_name}")
-                    
-                    # Insert new data
-                    df.to_sql(sheet_name, self.conn, if_exists='append', index=False)
-                
-                self.conn.commit()
-                self.db_status_label.config(text=f"Data imported from: {import_file}")
-                messagebox.showinfo("Success", "Database imported from Excel successfully. Please refresh views.")
-            except Exception as e:
-                self.db_status_label.config(text=f"Import failed: {str(e)}")
+            events = queue.Queue()
+
+            def run():
+                try:
+                    counts = import_excel(
+                        self.db,
+                        import_file,
+                        mode,
+                        progress=lambda table, count: events.put(("progress", (table, count)))
+                    )
+                    events.put(("done", counts))
+                except Exception as e:
+                    events.put(("error", e))
+
+            def set_status(text):
+                self.status_label.config(text=text)
+                if self.db_status_label.winfo_exists():
+                    self.db_status_label.config(text=text)
+
+            def poll():
+                try:
+                    while True:
+                        kind, payload = events.get_nowait()
+                        if kind == "progress":
+                            table, count = payload
+                            set_status(f"Checking {table}... {count} rows")
+                        elif kind == "done":
+                            self.reload_database_views()
+                            set_status(f"Data imported from: {import_file}")
+                            summary = "\n".join(f"{table}: {count} rows" for table, count in payload.items())
+                            messagebox.showinfo("Success", f"Database imported from Excel successfully.\n\n{summary}")
+                            return
+                        else:
+                            set_status("Import failed; the database was not changed")
+                            messagebox.showerror("Import Failed", str(payload))
+                            return
+                except queue.Empty:
+                    pass
+                self.master.after(200, poll)
+
+            set_status("Importing...")
+            threading.Thread(target=run, daemon=True).start()
+            poll()
 
     def show_about(self):
         """Show about dialog"""
@@ -2101,74 +5210,6 @@ class BillingSystem:
         # For now, just show a message
         messagebox.showinfo("Check for Updates", "You are using the latest version.")
 
-    def save_invoice_to_db(self, file_path):
-        """Save invoice data to database"""
-        try:
-            # Save invoice
-            self.cursor.execute('''
-                INSERT INTO invoices (
-                    invoice_number, date, customer_name, customer_mobile, 
-                    customer_place, customer_address, bill_type, subtotal, 
-                    sgst, igst, roundoff, total, pdf_path
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                self.invoice_number,
-                self.date,
-                self.name_entry.get(),
-                self.mobile_entry.get(),
-                self.place_entry.get(),
-                self.address_entry.get(),
-                self.bill_type_var.get(),
-                float(self.subtotal_var.get()),
-                float(self.sgst_var.get()),
-                float(self.igst_var.get()),
-                float(self.roundoff_var.get()),
-                float(self.total_cost_var.get()),
-                file_path
-            ))
-            
-            # Get the invoice ID
-            invoice_id = self.cursor.lastrowid
-            
-            # Save invoice items
-            for child in self.product_table.get_children():
-                values = self.product_table.item(child, "values")
-                self.cursor.execute('''
-                    INSERT INTO invoice_items (
-                        invoice_id, sno, hsn, description, price, quantity, total
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    invoice_id,
-                    values[0],
-                    values[1],
-                    values[2],
-                    float(values[3]),
-                    int(values[4]),
-                    float(values[5])
-                ))
-            
-            # Commit changes
-            self.conn.commit()
-            
-            # Add customer to database if not exists
-            if self.mobile_entry.get():
-                self.cursor.execute('''
-                    INSERT OR IGNORE INTO customers (name, mobile, place, address)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    self.name_entry.get(),
-                    self.mobile_entry.get(),
-                    self.place_entry.get(),
-                    self.address_entry.get()
-                ))
-                self.conn.commit()
-            
-            return True
-        except Exception as e:
-            self.conn.rollback()
-            messagebox.showerror("Database Error", f"Failed to save invoice: {str(e)}")
-            return False
-
     def find_invoice(self):
         """Find and load an existing invoice"""
         find_dialog = tk.Toplevel(self.master)
@@ -2192,13 +5233,20 @@ class BillingSystem:
             variable=search_type, 
             value="customer_mobile"
         ).grid(row=1, column=1, padx=5, pady=5, sticky="w")
+
+        ttk.Radiobutton(
+            find_dialog, 
+            text="Customer, Place or Item", 
+            variable=search_type, 
+            value="text"
+        ).grid(row=2, column=1, padx=5, pady=5, sticky="w")
         
-        ttk.Label(find_dialog, text="Search Value:").grid(row=2, column=0, padx=5, pady=5)
+        ttk.Label(find_dialog, text="Search Value:").grid(row=3, column=0, padx=5, pady=5)
         search_entry = ttk.Entry(find_dialog)
-        search_entry.grid(row=2, column=1, padx=5, pady=5)
+        search_entry.grid(row=3, column=1, padx=5, pady=5)
         
         results_frame = ttk.Frame(find_dialog)
-        results_frame.grid(row=3, column=0, columnspan=2, padx=5, pady=5)
+        results_frame.grid(row=4, column=0, columnspan=2, padx=5, pady=5)
         
         results_tree = ttk.Treeview(
             results_frame,
@@ -2221,21 +5269,27 @@ class BillingSystem:
         results_tree.column("Total", width=80, anchor="e")
         
         y_scroll = ttk.Scrollbar(results_frame, orient="vertical", command=results_tree.yview)
-        results_tree.configure(yscrollcommand=y_scroll.set)
+        results_view = PagedTreeview(
+            results_tree,
+            y_scroll,
+            format_row=lambda row: (row[0], row[1], to_display_date(row[2]), *row[3:])
+        )
         
         results_tree.pack(side="left", fill="both", expand=True)
         y_scroll.pack(side="right", fill="y")
         
         def search_invoices():
             """Search invoices based on criteria"""
-            for item in results_tree.get_children():
-                results_tree.delete(item)
-            
-            query = f"SELECT id, invoice_number, date, customer_name, customer_mobile, total FROM invoices WHERE {search_type.get()} LIKE ? ORDER BY date DESC"
-            self.cursor.execute(query, (f"%{search_entry.get()}%",))
-            
-            for row in self.cursor.fetchall():
-                results_tree.insert("", "end", values=row)
+            value = search_entry.get().strip()
+            column = search_type.get()
+            if column == "text":
+                # Ranked full-text search, including line item descriptions
+                results_view.show(lambda after, limit: self.fetch_records("invoices", value, after, limit))
+            else:
+                def fetch(after, limit):
+                    with self.db.read() as conn:
+                        return find_invoices(conn, column, value, after, limit)
+                results_view.show(fetch)
         
         def load_invoice():
             """Load selected invoice"""
@@ -2251,99 +5305,100 @@ class BillingSystem:
             find_dialog, 
             text="Search", 
             command=search_invoices
-        ).grid(row=4, column=0, padx=5, pady=5)
+        ).grid(row=5, column=0, padx=5, pady=5)
         
         ttk.Button(
             find_dialog, 
             text="Load Selected", 
             command=load_invoice,
             style="Accent.TButton"
-        ).grid(row=4, column=1, padx=5, pady=5)
+        ).grid(row=5, column=1, padx=5, pady=5)
 
     def load_invoice_from_db(self, invoice_id):
         """Load invoice from database"""
         try:
-            # Get invoice details
-            self.cursor.execute('''
-                SELECT invoice_number, date, customer_name, customer_mobile, 
-                       customer_place, customer_address, bill_type, subtotal, 
-                       sgst, igst, roundoff, total 
-                FROM invoices WHERE id = ?
-            ''', (invoice_id,))
-            invoice_data = self.cursor.fetchone()
+            with self.db.read() as conn:
+                record = load_invoice_record(conn, invoice_id)
             
-            if not invoice_data:
+            if not record:
                 messagebox.showerror("Error", "Invoice not found")
                 return
-                
-            # Clear current invoice
-            self.clear_all()
-            
-            # Set invoice details
-            self.invoice_number = invoice_data[0]
-            self.date = invoice_data[1]
-            self.invoice_label.config(text=f"Invoice No: {self.invoice_number:04d}")
-            self.date_label.config(text=f"Date: {self.date}")
-            
-            # Set customer details
-            self.name_entry.insert(0, invoice_data[2])
-            self.mobile_entry.insert(0, invoice_data[3])
-            self.place_entry.insert(0, invoice_data[4])
-            self.address_entry.insert(0, invoice_data[5])
-            self.bill_type_var.set(invoice_data[6])
-            
-            # Get invoice items
-            self.cursor.execute('''
-                SELECT sno, hsn, description, price, quantity, total 
-                FROM invoice_items 
-                WHERE invoice_id = ?
-                ORDER BY sno
-            ''', (invoice_id,))
-            
-            items = self.cursor.fetchall()
-            
-            # Add items to table
-            for item in items:
-                self.product_table.insert("", "end", values=item)
-            
-            # Set totals
-            self.subtotal_var.set(f"{invoice_data[7]:.2f}")
-            self.sgst_var.set(f"{invoice_data[8]:.2f}")
-            self.igst_var.set(f"{invoice_data[9]:.2f}")
-            self.roundoff_var.set(f"{invoice_data[10]:.2f}")
-            self.total_cost_var.set(f"{invoice_data[11]:.2f}")
-            
-            # Update amount in words
-            grand_total_in_words = num2words(float(invoice_data[11])).title() + " Rupees Only"
-            self.grand_total_words_var.set(grand_total_in_words)
+            if self.invoice_model and not messagebox.askyesno("Confirm", "Replace the invoice being edited?"):
+                return
+
+            # Saving it again asks to store a copy under a new number
+            self.load_record(record)
+            self.loaded_invoice_id = invoice_id
             
             messagebox.showinfo("Success", "Invoice loaded successfully")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load invoice: {str(e)}")
 
+    def load_record(self, record):
+        """Show an invoice record, as snapshot_invoice makes them, in the editor"""
+        self.invoice_model.clear()
+        self.loaded_invoice_id = None
+        
+        # Set invoice details
+        self.invoice_number = record["invoice_number"]
+        self.date = record["date"]
+        self.invoice_label.config(text=f"Invoice No: {format_invoice_number(self.invoice_number, record['series'])}")
+        self.date_label.config(text=f"Date: {self.date}")
+        
+        # Set customer details
+        customer = record["customer"]
+        for entry, value in (
+            (self.name_entry, customer["name"]),
+            (self.mobile_entry, customer["mobile"]),
+            (self.place_entry, customer["place"]),
+            (self.address_entry, customer["address"])
+        ):
+            entry.delete(0, tk.END)
+            entry.insert(0, value)
+        self.bill_type_var.set(record["bill_type"])
+        
+        # Add items to the invoice
+        for sno, hsn, description, price, quantity, total in record["items"]:
+            self.invoice_model.add(hsn, description, price, quantity)
+        
+        # Any gap between the items and the stored subtotal was a discount
+        accumulator = self.invoice_model.totals
+        discount = accumulator.items_paise - to_paise(record["subtotal"])
+        if 0 < discount <= accumulator.items_paise:
+            accumulator.set_discount(discount)
+        
+        # Set totals as they were stored, whatever the tax rates are now
+        self.subtotal_var.set(f"{record['subtotal']:.2f}")
+        self.sgst_var.set(f"{record['sgst']:.2f}")
+        self.igst_var.set(f"{record['igst']:.2f}")
+        self.roundoff_var.set(f"{record['roundoff']:.2f}")
+        self.total_cost_var.set(f"{record['total']:.2f}")
+        
+        # Update amount in words
+        self.grand_total_words_var.set(amount_in_words(to_paise(record["total"])))
+
     def add_to_product_history(self, hsn, name, price):
         """Add product to history if not already exists"""
         try:
-            # Check if product already exists in database
-            self.cursor.execute("SELECT id FROM products WHERE hsn = ?", (hsn,))
-            if not self.cursor.fetchone():
-                # Add to database
-                self.cursor.execute('''
-                    INSERT INTO products (hsn, name, price)
+            # Add to database unless a product with this HSN already exists
+            with self.db.write() as conn:
+                inserted = conn.execute('''
+                    INSERT OR IGNORE INTO products (hsn, name, price)
                     VALUES (?, ?, ?)
-                ''', (hsn, name, price))
-                self.conn.commit()
+                ''', (hsn, name, price)).rowcount
+            if inserted:
                 
                 # Add to local list
-                self.products.append({
+                product = {
                     "hsn": hsn,
                     "name": name,
                     "price": price
-                })
+                }
+                self.products.append(product)
+                self.product_index.add(product)
                 
                 # Update combobox values
-                self.product_id_entry["values"] = [p["hsn"] for p in self.products]
-                self.product_name_entry["values"] = [p["name"] for p in self.products]
+                self.update_product_choices()
         except Exception as e:
             print(f"Error adding product to database: {e}")
 
@@ -2355,29 +5410,38 @@ class BillingSystem:
     def load_product_history(self):
         """Load product history from database"""
         try:
-            self.cursor.execute("SELECT hsn, name, price FROM products")
+            with self.db.read() as conn:
+                rows = conn.execute("SELECT hsn, name, price FROM products").fetchall()
             self.products = []
-            for row in self.cursor.fetchall():
+            for row in rows:
                 self.products.append({
                     "hsn": row[0],
                     "name": row[1],
                     "price": row[2]
                 })
+            self.product_index.rebuild(self.products)
+            self.update_product_choices()
         except Exception as e:
             print(f"Error loading product history: {e}")
 
     def search_products(self, event):
         """Search products based on HSN or name"""
-        search_term = event.widget.get().lower()
-        
         if event.widget == self.product_id_entry:
             # Search by HSN
-            results = [p["hsn"] for p in self.products if search_term in p["hsn"].lower()]
-            self.product_id_entry["values"] = results
+            self.product_autocomplete["hsn"].trigger(event.widget.get())
         elif event.widget == self.product_name_entry:
             # Search by name
-            results = [p["name"] for p in self.products if search_term in p["name"].lower()]
-            self.product_name_entry["values"] = results
+            self.product_autocomplete["name"].trigger(event.widget.get())
+
+    def show_product_choices(self, field, results):
+        """Offer the products found for the HSN or name box"""
+        widget = self.product_id_entry if field == "hsn" else self.product_name_entry
+        widget["values"] = [p[field] for p in results]
+
+    def update_product_choices(self):
+        """Offer the best matches for what is typed in the HSN and name boxes"""
+        for widget, field in ((self.product_id_entry, "hsn"), (self.product_name_entry, "name")):
+            widget["values"] = [p[field] for p in self.product_index.search(field, widget.get())]
 
     def show_product_history(self):
         """Show product history in a new window"""
@@ -2460,11 +5524,13 @@ class BillingSystem:
 
     def export_to_excel(self):
         """Export current invoice to Excel"""
-        if not self.product_table.get_children():
+        if not self.invoice_model:
             messagebox.showwarning("Warning", "No products added to the invoice")
             return
             
-        default_filename = f"Invoice_{self.invoice_number:04d}_{self.date.replace('-', '')}.xlsx"
+        # The same record the PDF is made from
+        record = self.snapshot_invoice()
+        default_filename = str(Path(invoice_pdf_filename(record)).with_suffix(".xlsx"))
         file_path = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
             filetypes=[("Excel files", "*.xlsx")],
@@ -2475,26 +5541,25 @@ class BillingSystem:
             try:
                 # Create DataFrame for products
                 products_data = []
-                for child in self.product_table.get_children():
-                    values = self.product_table.item(child, "values")
+                for sno, hsn, description, price, quantity, total in record["items"]:
                     products_data.append({
-                        "S.No": values[0],
-                        "HSN": values[1],
-                        "Product Description": values[2],
-                        "Price": float(values[3]),
-                        "Quantity": int(values[4]),
-                        "Total": float(values[5])
+                        "S.No": sno,
+                        "HSN": hsn,
+                        "Product Description": description,
+                        "Price": price,
+                        "Quantity": quantity,
+                        "Total": total
                     })
                 
                 df_products = pd.DataFrame(products_data)
                 
                 # Create DataFrame for totals
                 totals_data = [{
-                    "Subtotal": float(self.subtotal_var.get()),
-                    f"SGST ({self.config['tax_rates']['sgst']}%)": float(self.sgst_var.get()),
-                    f"IGST ({self.config['tax_rates']['igst']}%)": float(self.igst_var.get()),
-                    "Roundoff": float(self.roundoff_var.get()),
-                    "Grand Total": float(self.total_cost_var.get())
+                    "Subtotal": record["subtotal"],
+                    f"SGST ({self.config['tax_rates']['sgst']}%)": record["sgst"],
+                    f"IGST ({self.config['tax_rates']['igst']}%)": record["igst"],
+                    "Roundoff": record["roundoff"],
+                    "Grand Total": record["total"]
                 }]
                 
                 df_totals = pd.DataFrame(totals_data)
@@ -2508,15 +5573,16 @@ class BillingSystem:
                     df_totals.to_excel(writer, sheet_name="Totals", index=False)
                     
                     # Write invoice info sheet
+                    customer = record["customer"]
                     invoice_info = {
-                        "Invoice Number": [self.invoice_number],
-                        "Date": [self.date],
-                        "Customer Name": [self.name_entry.get()],
-                        "Customer Mobile": [self.mobile_entry.get()],
-                        "Customer Place": [self.place_entry.get()],
-                        "Customer Address": [self.address_entry.get()],
-                        "Bill Type": [self.bill_type_var.get()],
-                        "Amount in Words": [self.grand_total_words_var.get()]
+                        "Invoice Number": [format_invoice_number(record["invoice_number"], record["series"])],
+                        "Date": [record["date"]],
+                        "Customer Name": [customer["name"]],
+                        "Customer Mobile": [customer["mobile"]],
+                        "Customer Place": [customer["place"]],
+                        "Customer Address": [customer["address"]],
+                        "Bill Type": [record["bill_type"]],
+                        "Amount in Words": [amount_in_words(to_paise(record["total"]))]
                     }
                     
                     df_info = pd.DataFrame(invoice_info)
@@ -2528,28 +5594,12 @@ class BillingSystem:
 
     def generate_qr_code(self):
         """Generate QR code for the current invoice"""
-        if not self.product_table.get_children():
+        if not self.invoice_model:
             messagebox.showwarning("Warning", "No products added to the invoice")
             return
             
-        qr_data = f"""
-        Company: {self.config['company_name']}
-        Invoice No: {self.invoice_number:04d}
-        Date: {self.date}
-        Customer: {self.name_entry.get()}
-        Total: {self.total_cost_var.get()}
-        """
-        
         try:
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
+            qr = make_qr(invoice_qr_data(self.snapshot_invoice(), self.config), box_size=10)
             img = qr.make_image(fill_color="black", back_color="white")
             
             # Show QR code in a new window
@@ -2597,38 +5647,33 @@ class BillingSystem:
     def load_products_table(self):
         """Load products into the products table"""
         try:
-            # Clear existing data
-            for item in self.products_table.get_children():
-                self.products_table.delete(item)
-            
-            # Load from database
-            self.cursor.execute("SELECT id, hsn, name, price, category, last_updated FROM products")
-            for row in self.cursor.fetchall():
-                self.products_table.insert("", "end", values=row)
+            self.show_records(self.products_view, "products", "")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load products: {str(e)}")
 
+    def show_records(self, view, table, text, first_page=None, version=None):
+        """Show the rows of a table that match text in a paged view"""
+        view.show(
+            lambda after, limit: self.fetch_records(table, text, after, limit),
+            first_page,
+            version=self.db.write_sequence if first_page is None else version
+        )
+
+    def fetch_records(self, table, text, after, limit):
+        """One page of search_records"""
+        with self.db.read() as conn:
+            return search_records(conn, table, text, after, limit)
+
     def search_products_in_db(self, event):
-        """Search products in database"""
-        search_term = self.product_search.get().lower()
-        
-        try:
-            # Clear existing data
-            for item in self.products_table.get_children():
-                self.products_table.delete(item)
-            
-            # Search in database
-            query = '''
-                SELECT id, hsn, name, price, category, last_updated 
-                FROM products 
-                WHERE hsn LIKE ? OR name LIKE ? OR category LIKE ?
-            '''
-            self.cursor.execute(query, (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"))
-            
-            for row in self.cursor.fetchall():
-                self.products_table.insert("", "end", values=row)
-        except Exception as e:
-            messagebox.showerror("Error", f"Search failed: {str(e)}")
+        """Search products in database once typing pauses"""
+        self.products_table_search.trigger(self.product_search.get())
+
+    def query_products_table(self, search_term, cancelled):
+        """First page of the products matching a search, run on a worker thread"""
+        version = self.db.write_sequence
+        with self.db.read(background=True) as conn, interruptible(conn, cancelled):
+            page = search_records(conn, "products", search_term, limit=self.products_view.page_size)
+        return search_term, page, version
 
     def add_product_dialog(self):
         """Show dialog to add a new product"""
@@ -2660,30 +5705,31 @@ class BillingSystem:
         def save_product():
             """Save the new product to database"""
             try:
-                self.cursor.execute('''
-                    INSERT INTO products (hsn, name, price, category)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    hsn_entry.get(),
-                    name_entry.get(),
-                    float(price_entry.get()),
-                    category_entry.get()
-                ))
-                self.conn.commit()
+                with self.db.write() as conn:
+                    conn.execute('''
+                        INSERT INTO products (hsn, name, price, category)
+                        VALUES (?, ?, ?, ?)
+                    ''', (
+                        hsn_entry.get(),
+                        name_entry.get(),
+                        float(price_entry.get()),
+                        category_entry.get()
+                    ))
                 
                 # Refresh products table
                 self.load_products_table()
                 
                 # Add to local products list
-                self.products.append({
+                product = {
                     "hsn": hsn_entry.get(),
                     "name": name_entry.get(),
                     "price": float(price_entry.get())
-                })
+                }
+                self.products.append(product)
+                self.product_index.add(product)
                 
                 # Update combobox values
-                self.product_id_entry["values"] = [p["hsn"] for p in self.products]
-                self.product_name_entry["values"] = [p["name"] for p in self.products]
+                self.update_product_choices()
                 
                 dialog.destroy()
                 messagebox.showinfo("Success", "Product added successfully")
@@ -2707,8 +5753,8 @@ class BillingSystem:
         product_id = self.products_table.item(selected[0], "values")[0]
         
         # Get product details from database
-        self.cursor.execute("SELECT hsn, name, price, category FROM products WHERE id = ?", (product_id,))
-        product = self.cursor.fetchone()
+        with self.db.read() as conn:
+            product = conn.execute("SELECT hsn, name, price, category FROM products WHERE id = ?", (product_id,)).fetchone()
         
         if not product:
             messagebox.showerror("Error", "Product not found")
@@ -2746,18 +5792,18 @@ class BillingSystem:
         def save_changes():
             """Save edited product to database"""
             try:
-                self.cursor.execute('''
-                    UPDATE products 
-                    SET hsn = ?, name = ?, price = ?, category = ?
-                    WHERE id = ?
-                ''', (
-                    hsn_entry.get(),
-                    name_entry.get(),
-                    float(price_entry.get()),
-                    category_entry.get(),
-                    product_id
-                ))
-                self.conn.commit()
+                with self.db.write() as conn:
+                    conn.execute('''
+                        UPDATE products
+                        SET hsn = ?, name = ?, price = ?, category = ?
+                        WHERE id = ?
+                    ''', (
+                        hsn_entry.get(),
+                        name_entry.get(),
+                        float(price_entry.get()),
+                        category_entry.get(),
+                        product_id
+                    ))
                 
                 # Refresh products table
                 self.load_products_table()
@@ -2765,14 +5811,15 @@ class BillingSystem:
                 # Update local products list
                 for p in self.products:
                     if p["hsn"] == product[0]:
+                        self.product_index.remove(p["hsn"])
                         p["hsn"] = hsn_entry.get()
                         p["name"] = name_entry.get()
                         p["price"] = float(price_entry.get())
+                        self.product_index.add(p)
                         break
                 
                 # Update combobox values
-                self.product_id_entry["values"] = [p["hsn"] for p in self.products]
-                self.product_name_entry["values"] = [p["name"] for p in self.products]
+                self.update_product_choices()
                 
                 dialog.destroy()
                 messagebox.showinfo("Success", "Product updated successfully")
@@ -2800,18 +5847,18 @@ class BillingSystem:
             return
             
         try:
-            self.cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-            self.conn.commit()
+            with self.db.write() as conn:
+                conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
             
             # Refresh products table
             self.load_products_table()
             
             # Remove from local products list
             self.products = [p for p in self.products if p["hsn"] != product_hsn]
+            self.product_index.remove(product_hsn)
             
             # Update combobox values
-            self.product_id_entry["values"] = [p["hsn"] for p in self.products]
-            self.product_name_entry["values"] = [p["name"] for p in self.products]
+            self.update_product_choices()
             
             messagebox.showinfo("Success", "Product deleted successfully")
         except Exception as e:
@@ -2820,39 +5867,20 @@ class BillingSystem:
     def load_customers_table(self):
         """Load customers into the customers table"""
         try:
-            # Clear existing data
-            for item in self.customers_table.get_children():
-                self.customers_table.delete(item)
-            
-            # Load from database
-            self.cursor.execute("SELECT id, name, mobile, place, address, gstin, created_at FROM customers")
-            for row in self.cursor.fetchall():
-                self.customers_table.insert("", "end", values=row)
+            self.show_records(self.customers_view, "customers", "")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load customers: {str(e)}")
 
     def search_customers_in_db(self, event):
-        """Search customers in database"""
-        search_term = self.customer_search.get().lower()
-        
-        try:
-            # Clear existing data
-            for item in self.customers_table.get_children():
-                self.customers_table.delete(item)
-            
-            # Search in database
-            query = '''
-                SELECT id, name, mobile, place, address, gstin, created_at 
-                FROM customers 
-                WHERE name LIKE ? OR mobile LIKE ? OR place LIKE ? OR gstin LIKE ?
-            '''
-            self.cursor.execute(query, 
-                (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"))
-            
-            for row in self.cursor.fetchall():
-                self.customers_table.insert("", "end", values=row)
-        except Exception as e:
-            messagebox.showerror("Error", f"Search failed: {str(e)}")
+        """Search customers in database once typing pauses"""
+        self.customers_table_search.trigger(self.customer_search.get())
+
+    def query_customers_table(self, search_term, cancelled):
+        """First page of the customers matching a search, run on a worker thread"""
+        version = self.db.write_sequence
+        with self.db.read(background=True) as conn, interruptible(conn, cancelled):
+            page = search_records(conn, "customers", search_term, limit=self.customers_view.page_size)
+        return search_term, page, version
 
     def add_customer_dialog(self):
         """Show dialog to add a new customer"""
@@ -2889,17 +5917,17 @@ class BillingSystem:
         def save_customer():
             """Save the new customer to database"""
             try:
-                self.cursor.execute('''
-                    INSERT INTO customers (name, mobile, place, address, gstin)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    name_entry.get(),
-                    mobile_entry.get(),
-                    place_entry.get(),
-                    address_entry.get(),
-                    gstin_entry.get()
-                ))
-                self.conn.commit()
+                with self.db.write() as conn:
+                    conn.execute('''
+                        INSERT INTO customers (name, mobile, place, address, gstin)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (
+                        name_entry.get(),
+                        mobile_entry.get(),
+                        place_entry.get(),
+                        address_entry.get(),
+                        gstin_entry.get()
+                    ))
                 
                 # Refresh customers table
                 self.load_customers_table()
@@ -2926,8 +5954,8 @@ class BillingSystem:
         customer_id = self.customers_table.item(selected[0], "values")[0]
         
         # Get customer details from database
-        self.cursor.execute("SELECT name, mobile, place, address, gstin FROM customers WHERE id = ?", (customer_id,))
-        customer = self.cursor.fetchone()
+        with self.db.read() as conn:
+            customer = conn.execute("SELECT name, mobile, place, address, gstin FROM customers WHERE id = ?", (customer_id,)).fetchone()
         
         if not customer:
             messagebox.showerror("Error", "Customer not found")
@@ -2971,19 +5999,19 @@ class BillingSystem:
         def save_changes():
             """Save edited customer to database"""
             try:
-                self.cursor.execute('''
-                    UPDATE customers 
-                    SET name = ?, mobile = ?, place = ?, address = ?, gstin = ?
-                    WHERE id = ?
-                ''', (
-                    name_entry.get(),
-                    mobile_entry.get(),
-                    place_entry.get(),
-                    address_entry.get(),
-                    gstin_entry.get(),
-                    customer_id
-                ))
-                self.conn.commit()
+                with self.db.write() as conn:
+                    conn.execute('''
+                        UPDATE customers
+                        SET name = ?, mobile = ?, place = ?, address = ?, gstin = ?
+                        WHERE id = ?
+                    ''', (
+                        name_entry.get(),
+                        mobile_entry.get(),
+                        place_entry.get(),
+                        address_entry.get(),
+                        gstin_entry.get(),
+                        customer_id
+                    ))
                 
                 # Refresh customers table
                 self.load_customers_table()
@@ -3014,8 +6042,8 @@ class BillingSystem:
             return
             
         try:
-            self.cursor.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
-            self.conn.commit()
+            with self.db.write() as conn:
+                conn.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
             
             # Refresh customers table
             self.load_customers_table()
@@ -3032,117 +6060,104 @@ class BillingSystem:
         if not from_date or not to_date:
             messagebox.showwarning("Warning", "Please enter both from and to dates")
             return
-            
+
         try:
-            # Get sales data
-            query = '''
-                SELECT date, invoice_number, customer_name, total 
-                FROM invoices 
-                WHERE date BETWEEN ? AND ?
-                ORDER BY date
-            '''
-            self.cursor.execute(query, (from_date, to_date))
-            sales_data = self.cursor.fetchall()
-            
-            if not sales_data:
-                self.report_text.delete(1.0, tk.END)
-                self.report_text.insert(tk.END, "No sales data found for the selected period")
-                return
-                
-            # Calculate totals
-            total_sales = sum(row[3] for row in sales_data)
-            total_invoices = len(sales_data)
-            
-            # Format report
-            report = f"Sales Report from {from_date} to {to_date}\n"
-            report += "=" * 50 + "\n\n"
-            report += f"{'Date':<12}{'Invoice No':<12}{'Customer':<30}{'Amount':>10}\n"
-            report += "-" * 64 + "\n"
-            
-            for row in sales_data:
-                report += f"{row[0]:<12}{row[1]:<12}{row[2][:28]:<30}{row[3]:>10.2f}\n"
-            
-            report += "\n" + "=" * 50 + "\n"
-            report += f"Total Invoices: {total_invoices}\n"
-            report += f"Total Sales: {total_sales:.2f}\n"
-            
-            # Display report
-            self.report_text.delete(1.0, tk.END)
-            self.report_text.insert(tk.END, report)
-            
-            # Generate chart
-            self.generate_sales_chart(sales_data)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {str(e)}")
+            date_range = (to_iso_date(from_date), to_iso_date(to_date))
+        except ValueError:
+            messagebox.showwarning("Warning", "Please enter dates as DD-MM-YYYY")
+            return
+
+        self.report_cache.request(
+            "sales",
+            ("sales", date_range),
+            lambda conn: sales_report(conn, from_date, to_date),
+            self.show_sales_report,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to generate report: {str(e)}")
+        )
 
-    def generate_sales_chart(self, sales_data):
-        """Generate sales chart from sales data"""
+    def show_sales_report(self, result):
+        """Display a report computed by sales_report"""
+        report, chart = result
+        self.report_text.delete(1.0, tk.END)
+        self.report_text.insert(tk.END, report)
+        if chart is not None:
+            self.generate_sales_chart(*chart)
+        elif self.sales_steps is not None:
+            # Leave no chart of an earlier range behind
+            self.sales_steps.set_visible(False)
+            self.sales_ax.set_title("No sales in the selected period")
+            self.sales_canvas.draw_idle()
+
+    def generate_sales_chart(self, unit, edges, totals):
+        """Draw sales buckets from sales_buckets as a step chart"""
         try:
-            # Clear previous chart
-            self.sales_ax.clear()
-            
-            # Prepare data
-            dates = [row[0] for row in sales_data]
-            amounts = [row[3] for row in sales_data]
-            
-            # Create bar chart
-            self.sales_ax.bar(dates, amounts, color=self.config["secondary_color"])
-            self.sales_ax.set_title("Sales by Date")
-            self.sales_ax.set_xlabel("Date")
-            self.sales_ax.set_ylabel("Amount")
-            
-            # Rotate x-axis labels for better readability
-            for label in self.sales_ax.get_xticklabels():
-                label.set_rotation(45)
-                label.set_ha('right')
-            
+            x = mdates.date2num(edges)
+            if self.sales_steps is None:
+                self.sales_steps = self.sales_ax.stairs(totals, x, fill=True)
+                locator = mdates.AutoDateLocator()
+                self.sales_ax.xaxis.set_major_locator(locator)
+                self.sales_ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+                self.sales_ax.set_ylabel("Amount")
+            else:
+                # Updating the one artist is much cheaper than clearing the axes
+                self.sales_steps.set_data(totals, x)
+                self.sales_steps.set_visible(True)
+            self.sales_steps.set_color(self.config["secondary_color"])
+            self.sales_ax.set_title(f"Sales by {unit.title()}")
+            self.sales_ax.set_xlim(x[0], x[-1])
+            self.sales_ax.set_ylim(min(totals.min(), 0), max(totals.max(), 1) * 1.05)
+
             # Redraw canvas
-            self.sales_canvas.draw()
+            self.sales_canvas.draw_idle()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to generate chart: {str(e)}")
 
     def generate_product_report(self):
         """Generate product sales report"""
+        self.report_cache.request(
+            "products",
+            ("products",),
+            product_report,
+            self.show_product_report,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to generate report: {str(e)}")
+        )
+
+    def show_product_report(self, report):
+        """Display a report computed by product_report"""
+        self.product_report_text.delete(1.0, tk.END)
+        self.product_report_text.insert(tk.END, report)
+
+    def generate_analytics_report(self):
+        """Run the selected analysis over the Sales Report date range"""
+        from_date = self.from_date.get()
+        to_date = self.to_date.get()
+
         try:
-            # Get product sales data
-            query = '''
-                SELECT p.hsn, p.name, SUM(ii.quantity) as total_quantity, 
-                       SUM(ii.total) as total_sales
-                FROM products p
-                JOIN invoice_items ii ON p.hsn = ii.hsn
-                GROUP BY p.hsn, p.name
-                ORDER BY total_sales DESC
-            '''
-            self.cursor.execute(query)
-            product_data = self.cursor.fetchall()
-            
-            if not product_data:
-                self.product_report_text.delete(1.0, tk.END)
-                self.product_report_text.insert(tk.END, "No product sales data found")
-                return
-                
-            # Calculate totals
-            total_quantity = sum(row[2] for row in product_data)
-            total_sales = sum(row[3] for row in product_data)
-            
-            # Format report
-            report = "Product Sales Report\n"
-            report += "=" * 50 + "\n\n"
-            report += f"{'HSN':<10}{'Product Name':<30}{'Qty Sold':>10}{'Total Sales':>15}\n"
-            report += "-" * 65 + "\n"
-            
-            for row in product_data:
-                report += f"{row[0]:<10}{row[1][:28]:<30}{row[2]:>10}{row[3]:>15.2f}\n"
-            
-            report += "\n" + "=" * 50 + "\n"
-            report += f"Total Quantity Sold: {total_quantity}\n"
-            report += f"Total Sales: {total_sales:.2f}\n"
-            
-            # Display report
-            self.product_report_text.delete(1.0, tk.END)
-            self.product_report_text.insert(tk.END, report)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate report: {str(e)}")
+            date_range = (to_iso_date(from_date), to_iso_date(to_date)) if from_date and to_date else (None, None)
+        except ValueError:
+            messagebox.showwarning("Warning", "Please enter dates as DD-MM-YYYY")
+            return
+
+        name = self.analytics_var.get()
+        self.report_cache.request(
+            "analytics",
+            ("analytics", name, date_range),
+            lambda conn: analytics.as_table(analytics.run_report(conn, name, *date_range), DISPLAY_DATE_FORMAT),
+            self.show_analytics_report,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to generate report: {str(e)}")
+        )
+
+    def show_analytics_report(self, result):
+        """Display the (headings, rows) of an analysis"""
+        headings, rows = result
+        tree = self.analytics_tree
+        tree.delete(*tree.get_children())
+        tree.configure(columns=headings)
+        for heading in headings:
+            tree.heading(heading, text=heading, anchor="center")
+            tree.column(heading, width=110, anchor="w" if heading in ("Name", "Customer") else "e")
+        for row in rows:
+            tree.insert("", "end", values=row)
 
     def change_theme(self, theme_name):
         """Change application theme"""
@@ -3162,6 +6177,7 @@ class BillingSystem:
         elif current_tab == "Reports":
             self.generate_sales_report()
             self.generate_product_report()
+            self.generate_analytics_report()
         
         self.status_label.config(text="Data refreshed")
 
@@ -3170,27 +6186,43 @@ class BillingSystem:
         tab = self.notebook.tab(self.notebook.select(), "text")
         
         if tab == "Reports":
-            # Generate reports when tab is selected
+            # Recomputed only if invoices were saved since they were last shown
             self.generate_sales_report()
             self.generate_product_report()
-        elif tab == "Products":
-            self.load_products_table()
-        elif tab == "Customers":
-            self.load_customers_table()
+            self.generate_analytics_report()
+        # Rows already shown stay unless something was saved since
+        elif tab == "Products" and self.products_view.version != self.db.write_sequence:
+            self.show_records(self.products_view, "products", self.product_search.get())
+        elif tab == "Customers" and self.customers_view.version != self.db.write_sequence:
+            self.show_records(self.customers_view, "customers", self.customer_search.get())
 
     def on_exit(self):
         """Handle application exit"""
         # Cancel auto-save timer if running
         if hasattr(self, 'auto_save_timer'):
             self.auto_save_timer.cancel()
-        
-        # Close database connection
-        self.conn.close()
+
+        # Let invoices that are still being saved finish
+        if self.job_queue.pending:
+            self.status_label.config(text="Finishing pending saves...")
+            self.master.update_idletasks()
+        self.job_queue.shutdown()
+
+        # Stop searches still running
+        for search in (*self.product_autocomplete.values(), self.products_table_search, self.customers_table_search):
+            search.cancel()
+        self.search_executor.shutdown(wait=True, cancel_futures=True)
+        self.report_executor.shutdown(wait=True, cancel_futures=True)
+
+        # Close database connections
+        self.backup_service.cancel()
+        self.db.close()
         
         # Close the application
         self.master.quit()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     
     # Set window icon
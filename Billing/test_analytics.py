@@ -0,0 +1,34 @@
+import unittest
+
+import pandas as pd
+
+from analytics import customer_lifetime_value
+
+
+class CustomerLifetimeValueTest(unittest.TestCase):
+    def setUp(self):
+        self.sales = pd.DataFrame({
+            "date": pd.to_datetime(["2024-01-01", "2024-07-01", "2024-12-30", "2024-12-30"]),
+            "customer": ["9000000001", "9000000001", "9000000001", "9000000002"],
+            "name": ["Regular", "Regular", "Regular", "Walk-in"],
+            "invoices": [1, 1, 1, 1],
+            "total": [1000.0, 1000.0, 1000.0, 5000.0],
+        })
+        self.customers = customer_lifetime_value(self.sales, lifespan_years=3.0).set_index("customer")
+
+    def test_single_purchase_customer_is_not_projected(self):
+        walk_in = self.customers.loc["9000000002"]
+
+        self.assertTrue(pd.isna(walk_in["yearly_value"]))
+        self.assertEqual(walk_in["lifetime_value"], 5000.0)
+
+    def test_repeat_customer_is_projected_from_the_analysed_period(self):
+        regular = self.customers.loc["9000000001"]
+
+        self.assertAlmostEqual(regular["yearly_value"], 3000.0, delta=10)
+        self.assertAlmostEqual(regular["lifetime_value"], 9000.0, delta=30)
+        self.assertEqual(self.customers.index[0], "9000000001")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from app import MIGRATIONS, Database, InvoiceRepository, _migrate_base_schema
+
+
+def make_record(number=0, date="01-04-2024", items=(("1001", "Widget", 100.0, 2),)):
+    items = [(sno, hsn, name, price, quantity, price * quantity)
+             for sno, (hsn, name, price, quantity) in enumerate(items, 1)]
+    subtotal = sum(item[5] for item in items)
+    return {
+        "invoice_number": number,
+        "series": "",
+        "date": date,
+        "bill_type": "Cash",
+        "customer": {"name": "Asha", "mobile": "9000000001", "place": "", "address": ""},
+        "items": items,
+        "subtotal": subtotal,
+        "sgst": 0.0,
+        "igst": 0.0,
+        "roundoff": 0.0,
+        "total": subtotal,
+    }
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_file = os.path.join(self.tmp.name, "billing.db")
+
+    def open_database(self):
+        db = Database(self.db_file)
+        self.addCleanup(db.close)
+        return db
+
+
+class MigrationTest(DatabaseTestCase):
+    def create_version_0(self, invoices):
+        # The schema the application created before it had migrations
+        conn = sqlite3.connect(self.db_file)
+        _migrate_base_schema(conn)
+        conn.executemany(
+            "INSERT INTO invoices (invoice_number, date, bill_type, subtotal, total) VALUES (?, ?, 'Cash', ?, ?)",
+            [(number, date, total, total) for number, date, total in invoices]
+        )
+        conn.commit()
+        conn.close()
+
+    def test_version_0_database_is_brought_up_to_date(self):
+        self.create_version_0([(1, "31-03-2024", 100.0), (2, "01-04-2024", 250.0)])
+
+        db = self.open_database()
+
+        with db.read() as conn:
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], len(MIGRATIONS))
+            self.assertEqual(
+                conn.execute("SELECT date FROM invoices ORDER BY invoice_number").fetchall(),
+                [("2024-03-31",), ("2024-04-01",)]
+            )
+            self.assertEqual(conn.execute("SELECT last_number FROM invoice_sequences").fetchall(), [(2,)])
+            self.assertEqual(conn.execute("SELECT SUM(total) FROM sales_daily").fetchone()[0], 350.0)
+
+    def test_duplicate_invoice_numbers_stop_the_migration(self):
+        self.create_version_0([(1, "31-03-2024", 100.0), (2, "01-04-2024", 250.0), (2, "02-04-2024", 80.0)])
+
+        with self.assertRaisesRegex(sqlite3.IntegrityError, r"2 \(2 invoices\)"):
+            Database(self.db_file)
+
+        conn = sqlite3.connect(self.db_file)
+        self.addCleanup(conn.close)
+        self.assertLess(conn.execute("PRAGMA user_version").fetchone()[0], len(MIGRATIONS))
+        self.assertEqual(
+            conn.execute("SELECT invoice_number FROM invoices ORDER BY id").fetchall(),
+            [(1,), (2,), (2,)]
+        )
+
+
+class InvoiceNumberTest(DatabaseTestCase):
+    def test_two_connections_never_reserve_the_same_number(self):
+        repositories = [InvoiceRepository(self.open_database()) for _ in range(2)]
+        start = threading.Barrier(len(repositories))
+        numbers = []
+        errors = []
+
+        def save(repository):
+            try:
+                start.wait()
+                for _ in range(25):
+                    record = make_record()
+                    repository.save(record, None, reserve=True)
+                    numbers.append(record["invoice_number"])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save, args=(repository,)) for repository in repositories]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(numbers), list(range(1, 51)))
+        with repositories[0].db.read() as conn:
+            self.assertEqual(conn.execute("SELECT last_number FROM invoice_sequences").fetchall(), [(50,)])
+
+
+class SaveManyTest(DatabaseTestCase):
+    def test_failed_save_leaves_nothing_behind(self):
+        db = self.open_database()
+        repository = InvoiceRepository(db)
+        broken = make_record(date="02-04-2024")
+        broken["items"] = [("1", "1002", "Gadget", 50.0, 1)]  # the line total is missing
+        records = [make_record(), broken]
+
+        with self.assertRaises(ValueError):
+            repository.save_many([(record, None) for record in records], reserve=True)
+
+        self.assertEqual([record["invoice_number"] for record in records], [0, 0])
+        with db.read() as conn:
+            for table in ("invoices", "invoice_items", "customers", "invoice_sequences",
+                          "sales_daily", "sales_daily_hsn", "sales_daily_customer", "invoices_fts"):
+                self.assertEqual(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], 0, table)
+
+        repository.save(make_record(), None, reserve=True)
+        with db.read() as conn:
+            self.assertEqual(conn.execute("SELECT invoice_number FROM invoices").fetchall(), [(1,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from app import InvoiceModel, to_paise
+
+
+class InvoiceModelDiscountTest(unittest.TestCase):
+    def setUp(self):
+        self.model = InvoiceModel()
+        self.line = self.model.add("1001", "Widget", 100, 5)
+        self.model.totals.set_discount(to_paise(300))
+
+    def test_edit_lowering_total_below_discount_drops_it(self):
+        self.model.update(self.line.iid, "1001", "Widget", 100, 2)
+
+        totals = self.model.totals.totals()
+        self.assertEqual(self.model.totals.discount_paise, 0)
+        self.assertEqual(totals.subtotal, to_paise(200))
+        self.assertGreaterEqual(totals.total, 0)
+
+    def test_edit_keeping_total_above_discount_keeps_it(self):
+        self.model.update(self.line.iid, "1001", "Widget", 100, 4)
+
+        self.assertEqual(self.model.totals.discount_paise, to_paise(300))
+        self.assertEqual(self.model.totals.totals().subtotal, to_paise(100))
+
+    def test_remove_below_discount_drops_it(self):
+        self.model.remove([self.line.iid])
+
+        self.assertEqual(self.model.totals.discount_paise, 0)
+        self.assertEqual(self.model.totals.totals().total, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()